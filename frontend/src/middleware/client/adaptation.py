@@ -0,0 +1,230 @@
+import hmac
+import struct
+
+from typing import NamedTuple
+
+from client.protocol import now_ms
+
+# region --- Feedback ---
+
+# Receiver report on one stream: stream_id, packets received, packets
+# lost, queueing delay (ms)
+FEEDBACK = struct.Struct('!IIII')
+# Truncated HMAC-SHA256 appended to each report; see `sign_feedback`
+FEEDBACK_TAG_SIZE = 16
+
+
+class Feedback(NamedTuple):
+    stream_id: int
+    received: int
+    lost: int
+    queue_delay: int  # ms
+
+    @property
+    def loss(self):
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+
+class ReceptionStats:
+    """
+    What the receiving side of a stream observes, reported back to the
+    sender as `Feedback`.
+
+    Loss is counted from gaps in packet sequence numbers. Queueing delay
+    is how much longer packets currently take to arrive than the fastest
+    one seen, i.e. how much is backed up somewhere along the path.
+    """
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.last_seq = None
+        self.min_transit = None
+        self.reset()
+
+    def reset(self):
+        self.received = 0
+        self.lost = 0
+        self.queue_delay = 0
+
+    def on_packet(self, seq, timestamp):
+        if self.last_seq is not None and seq > self.last_seq:
+            self.lost += seq - self.last_seq - 1
+        if self.last_seq is None or seq > self.last_seq:
+            self.last_seq = seq
+        self.received += 1
+
+        # Sender and receiver clocks differ, but only changes in transit
+        # time matter here
+        transit = (now_ms() - timestamp) & 0xFFFFFFFF
+        if self.min_transit is None or transit < self.min_transit:
+            self.min_transit = transit
+        self.queue_delay = transit - self.min_transit
+
+    def report(self):
+        """Return the report since the last call, packed for sending."""
+        report = FEEDBACK.pack(self.stream_id, self.received, self.lost,
+                               self.queue_delay)
+        self.reset()
+        return report
+
+
+def sign_feedback(report, key):
+    """
+    Append a tag made with the current epoch `key`, so peers cannot be
+    pushed to lower quality by forged reports. Reports are not secret.
+    """
+    return report + hmac.digest(key, report, 'sha256')[:FEEDBACK_TAG_SIZE]
+
+
+def unpack_feedback(payload, key):
+    """
+    Return the `Feedback` in a signed report, or `None` if its tag does
+    not match `key`.
+    """
+    payload = bytes(payload)
+    report = payload[:FEEDBACK.size]
+    tag = hmac.digest(key, report, 'sha256')[:FEEDBACK_TAG_SIZE]
+    if (len(payload) != FEEDBACK.size + FEEDBACK_TAG_SIZE
+            or not hmac.compare_digest(tag, payload[FEEDBACK.size:])):
+        return None
+    return Feedback(*FEEDBACK.unpack(report))
+
+# endregion
+
+
+# region --- Controller ---
+
+
+class Level(NamedTuple):
+    shape: tuple
+    frame_rate: int
+    bitrate: int
+
+
+class VideoController:
+    """
+    Picks the outgoing video resolution, frame rate and bitrate.
+
+    Levels are every combination of `shapes` and `frame_rates`, ordered
+    by pixel rate. Every `interval` seconds, `evaluate()` looks at what
+    happened since the last evaluation: frames dropped from the send
+    pipeline's queues, time spent handing frames to the encoder (which
+    blocks once the encoder, or anything after it, falls behind) relative
+    to the frame budget, and the latest receiver `Feedback`, whose
+    queueing delay counts from capture. Any sign of congestion steps one
+    level down (at most once per `interval`); `UPGRADE_AFTER` healthy
+    intervals in a row step one level back up. The interval right after a
+    change is ignored, as restarting the encoder disturbs it.
+
+    Parameters
+    ----------
+    shapes : list of tuple
+    frame_rates : list of int
+    start : Level or tuple, optional
+        (shape, frame_rate) to start at; defaults to the highest level.
+    interval : float, optional
+        Seconds between evaluations.
+    """
+    BITS_PER_PIXEL = 0.1
+    UPGRADE_AFTER = 5
+    # Congestion thresholds
+    MAX_ENCODE_LOAD = 0.5  # Share of the frame budget spent encoding
+    MAX_LOSS = 0.02
+    MAX_QUEUE_DELAY = 150  # ms
+
+    def __init__(self, shapes, frame_rates, start=None, interval=1.0):
+        self.levels = sorted(
+            (Level(shape, rate, self.bitrate(shape, rate))
+             for shape in shapes for rate in frame_rates),
+            key=lambda level: level.shape[0] * level.shape[1]
+            * level.frame_rate)
+        self.index = len(self.levels) - 1
+        if start is not None:
+            self.index = [level[:2] for level in self.levels].index(
+                tuple(start[:2]))
+        self.interval = interval
+
+        self.encode_time = 0.0
+        self.encoded = 0
+        self.feedback = None
+        self.healthy = 0
+        self.settling = False
+        self.changes = 0
+
+    def bitrate(self, shape, frame_rate):
+        return int(shape[0] * shape[1] * frame_rate * self.BITS_PER_PIXEL)
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    # region --- Inputs ---
+
+    def on_encode(self, seconds):
+        self.encode_time += seconds
+        self.encoded += 1
+
+    def on_feedback(self, feedback: Feedback):
+        self.feedback = feedback
+
+    def restore(self, level):
+        """Return to `level` after the latest change could not be applied."""
+        self.index = self.levels.index(level)
+
+    # endregion
+
+    def congested(self, dropped):
+        """Return why the current level is too high, or `None`."""
+        if dropped:
+            return f"{dropped} frames dropped"
+        if self.encoded:
+            load = self.encode_time / self.encoded * self.level.frame_rate
+            if load > self.MAX_ENCODE_LOAD:
+                return f"encoding uses {load:.0%} of the frame budget"
+        if self.feedback is not None:
+            if self.feedback.loss > self.MAX_LOSS:
+                return f"receiver lost {self.feedback.loss:.1%} of packets"
+            if self.feedback.queue_delay > self.MAX_QUEUE_DELAY:
+                return f"{self.feedback.queue_delay} ms queued in transit"
+        return None
+
+    def evaluate(self, dropped):
+        """
+        Decide on the level for the next interval.
+
+        Parameters
+        ----------
+        dropped : int
+            Frames dropped by the send pipeline since the last call.
+
+        Returns
+        -------
+        `(level, reason)` if the level should change, else `None`.
+        """
+        reason = self.congested(dropped)
+        self.encode_time, self.encoded = 0.0, 0
+        self.feedback = None
+
+        if self.settling:
+            self.settling = False
+            return None
+        if reason is not None:
+            self.healthy = 0
+            if self.index == 0:
+                return None
+            self.index -= 1
+        else:
+            self.healthy += 1
+            if (self.healthy < self.UPGRADE_AFTER
+                    or self.index == len(self.levels) - 1):
+                return None
+            self.healthy = 0
+            self.index += 1
+            reason = f"healthy for {self.UPGRADE_AFTER} intervals"
+
+        self.settling = True
+        self.changes += 1
+        return self.level, reason
+
+# endregion
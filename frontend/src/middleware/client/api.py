@@ -7,8 +7,11 @@ from functools import total_ordering
 from gevent.pywsgi import WSGIServer  # For asynchronous handling
 from threading import Thread
 
+from client.audio_codec import available_audio_codecs
+from client.encryption import persisted_offset
 from client.errors import Errors
 from client.endpoint import Endpoint
+from client.transport import MediaTransports
 from client.util import get_parameters
 from custom_logging import logger
 
@@ -152,16 +155,41 @@ class ClientAPI(Thread):
         ------------------
         peer_id : str
         socket_endpoint : tuple
+        key_epoch : float
+        key_offset : int
+            Key file offset the peer has used up to; see `KeySchedule`.
+        media_endpoint : tuple, optional
+            Direct media link offered by the peer.
+        media_transport : str, optional
+            `MediaTransports` name of that link; defaults to 'TCP'.
+        audio_codecs : list of str, optional
+            `AudioCodecs` names the peer can decode; PCM only if absent.
+
+        Responds with the `audio_codecs` this client can decode and the
+        `key_offset` both peers use: the larger of the peer's and ours.
         """
-        peer_id, socket_endpoint = get_parameters(
-            request.json, 'peer_id', 'socket_endpoint')
+        peer_id, socket_endpoint, key_epoch, key_offset = get_parameters(
+            request.json, 'peer_id', 'socket_endpoint',
+            ('key_epoch', lambda x: isinstance(x, (int, float))),
+            ('key_offset', lambda x: isinstance(x, int) and x >= 0))
+        key_offset = max(key_offset, persisted_offset())
         socket_endpoint = Endpoint(*socket_endpoint)
+        media_endpoint = request.json.get('media_endpoint')
+        if media_endpoint is not None:
+            media_endpoint = Endpoint(*media_endpoint)
+        media_transport = request.json.get('media_transport') or 'TCP'
+        if media_transport not in MediaTransports.__members__:
+            raise Errors.INVALIDPARAMETER.value(
+                "Parameter 'media_transport' failed validation.")
+        media_transport = MediaTransports[media_transport]
+        audio_codecs = request.json.get('audio_codecs')
         logger.info(f"Instructied to connect to peer {
                         peer_id} at {socket_endpoint}.")
 
         try:
             res = cls.client.handle_peer_connection(
-                peer_id, socket_endpoint)
+                peer_id, socket_endpoint, key_epoch, key_offset,
+                media_endpoint, media_transport, audio_codecs)
         except Exception as e:
             # TODO: Why did the connection fail?
             # TODO: Move into init
@@ -179,6 +207,8 @@ class ClientAPI(Thread):
                             "details": "Peer User refused connection"}), 418
         # TODO: What should we return?
         logger.info("Responding with 200")
-        return jsonify({'status_code': '200'}), 200
+        return jsonify({'status_code': '200',
+                        'audio_codecs': available_audio_codecs(),
+                        'key_offset': key_offset}), 200
     # endregion
 # endregion
@@ -0,0 +1,157 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+
+from client.protocol import Flags
+from custom_logging import logger
+
+try:
+    import opuslib
+except Exception:  # Missing package, or libopus itself is not installed
+    opuslib = None
+
+
+# Frame durations Opus can encode, in ms
+OPUS_FRAME_MS = (2.5, 5, 10, 20, 40, 60)
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class AbstractAudioCodec(ABC):
+    # Marks packets encoded with this codec; see `client.protocol.Flags`
+    flags = Flags.NONE
+
+    @abstractmethod
+    def encode(self, pcm):
+        """Encode one frame of mono int16 PCM."""
+        pass
+
+    @abstractmethod
+    def decode(self, data):
+        """Decode one frame back to mono int16 PCM."""
+        pass
+
+    @abstractmethod
+    def get_name(self):
+        """Returns the Audio Codec's name."""
+        pass
+
+    def conceal(self):
+        """
+        Return PCM standing in for one lost frame, or `None` if the codec
+        has no loss concealment of its own.
+        """
+        return None
+
+
+class PCMCodec(AbstractAudioCodec):
+    """Uncompressed passthrough; always available."""
+
+    def __init__(self, sample_rate=None, frame_size=None, bitrate=None):
+        self.name = 'PCM'
+
+    def encode(self, pcm):
+        return pcm
+
+    def decode(self, data):
+        return data
+
+    def get_name(self):
+        return self.name
+
+
+class OpusCodec(AbstractAudioCodec):
+    """
+    Opus (VoIP mode) via `opuslib`.
+
+    Parameters
+    ----------
+    sample_rate : int
+        One of `OPUS_SAMPLE_RATES`.
+    frame_size : int
+        Samples per frame; must be one of `OPUS_FRAME_MS` long.
+    bitrate : int, optional
+        Target bits per second.
+    """
+    flags = Flags.OPUS
+
+    def __init__(self, sample_rate, frame_size, bitrate=32000):
+        if opuslib is None:
+            raise ValueError("Opus is unavailable: opuslib not installed")
+        if sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus does not support {sample_rate} Hz")
+        if 1000 * frame_size / sample_rate not in OPUS_FRAME_MS:
+            raise ValueError(
+                f"Opus cannot encode {frame_size}-sample frames "
+                f"at {sample_rate} Hz")
+
+        self.name = 'Opus'
+        self.frame_size = frame_size
+        self.encoder = opuslib.Encoder(
+            sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+
+    def encode(self, pcm):
+        return self.encoder.encode(bytes(pcm), self.frame_size)
+
+    def decode(self, data):
+        return self.decoder.decode(bytes(data), self.frame_size)
+
+    def conceal(self):
+        # An empty packet makes libopus extrapolate from its decoder state
+        return self.decoder.decode(b'', self.frame_size)
+
+    def get_name(self):
+        return self.name
+
+
+class AudioCodecs(Enum):
+    ABSTRACT = AbstractAudioCodec
+    PCM = PCMCodec
+    OPUS = OpusCodec
+
+
+class AudioCodecFactory:
+    def create_audio_codec(self, type, sample_rate, frame_size,
+                           bitrate=32000) -> AbstractAudioCodec:
+        """
+        Create a codec of the requested type, falling back to PCM if it
+        cannot run here (e.g. Opus without libopus).
+        """
+        if type not in AudioCodecs:
+            raise ValueError("Invalid audio codec type")
+        try:
+            return type.value(sample_rate, frame_size, bitrate)
+        except ValueError as e:
+            if type == AudioCodecs.PCM:
+                raise e
+            logger.error(f"{e}; falling back to PCM audio.")
+            return PCMCodec()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def available_audio_codecs():
+    """
+    Names of the `AudioCodecs` that can run here, most preferred first.
+    Advertised to the peer at /peer_connection.
+    """
+    codecs = [AudioCodecs.PCM.name]
+    if opuslib is not None:
+        codecs.insert(0, AudioCodecs.OPUS.name)
+    return codecs
+
+
+def negotiate_audio_codec(preferred: AudioCodecs, peer_codecs):
+    """
+    Return `preferred` if both ends can run it, else PCM. Both peers reach
+    the same answer from each other's `available_audio_codecs()`.
+    `peer_codecs` of `None` (nothing advertised) means PCM only.
+    """
+    if (preferred.name in available_audio_codecs()
+            and preferred.name in (peer_codecs or ())):
+        return preferred
+    return AudioCodecs.PCM
@@ -1,16 +1,28 @@
 import socketio
-import asyncio
 import pyaudio
-import ffmpeg
-import cv2
+import threading
+import time
 
 from flask_socketio import send
 from flask_socketio.namespace import Namespace as FlaskNamespace
 from socketio import ClientNamespace
-from threading import Thread
 
-from client.encryption import KeyGenerators, KeyGenFactory, EncryptSchemes, EncryptFactory
+from client.adaptation import ReceptionStats, VideoController
+from client.adaptation import sign_feedback, unpack_feedback
+from client.audio_codec import AudioCodecs, AudioCodecFactory, PCMCodec
+from client.audio_codec import negotiate_audio_codec
+from client.capture import AudioCapture
+from client.codec import EncoderSession, DecoderSession, is_keyframe
+from client.encryption import EncryptSchemes, EncryptFactory, KeySchedule
+from client.encryption import KeyMaterialExhausted
+from client.frames import CameraSource, SyntheticSource
+from client.jitter import JitterBuffer
+from client.pipeline import Pipeline, Worker
+from client.protocol import Flags, PacketWriter, get_stream_id, now_ms
+from client.protocol import unpack
+from client.scheduler import MediaScheduler, MediaTask, Priority
 from client.util import ClientState, display_message
+from custom_logging import logger
 
 # region --- Tests ---
 
@@ -43,11 +55,10 @@ class TestClientNamespace(ClientNamespace):
         display_message(self.cls.user_id, "Connected to /test")
 
     def on_message(self, user_id, msg):
-        msg = '/test: ' + msg
+        self.cls.loop.submit(self.handle_message, user_id, msg)
 
-        async def disp():
-            display_message(user_id, msg)
-        asyncio.run(disp())
+    async def handle_message(self, user_id, msg):
+        display_message(user_id, '/test: ' + msg)
 
 # endregion
 
@@ -63,8 +74,9 @@ class BroadcastFlaskNamespace(FlaskNamespace):
     def on_connect(self):
         pass
 
-    def on_message(self, user_id, msg):
-        send((user_id, msg), broadcast=True, include_self=False)
+    def on_message(self, packet):
+        # Media packets are opaque binary frames; see `client.protocol`
+        send(packet, broadcast=True, include_self=False)
 
     def on_disconnect(self):
         if self.cls.client.state == ClientState.CONNECTED:
@@ -79,45 +91,17 @@ class AVClientNamespace(ClientNamespace):
         self.cls: type = cls
         self.av: AV = av
         self.frontend_socket: socketio.Client = frontend_socket
+        self.writer = PacketWriter(get_stream_id(cls.user_id, namespace))
         #logger.info("created AVClientNamespace", self.cls, self.av)
 
     def on_connect(self):
         pass
 
-    def on_message(self, user_id, msg):
+    def on_message(self, msg):
         pass
 
-    def send(self, msg):
-        self.cls.send_message(msg, namespace=self.namespace)
-
-# endregion
-
-
-# region --- Key Distributions ---
-
-class KeyClientNamespace(AVClientNamespace):
-
-    def on_connect(self):
-        super().on_connect()
-        self.key_idx = 0
-
-        async def gen_keys():
-            await asyncio.sleep(2)
-            while True:
-                self.av.key_gen.generate_key(key_length=128)
-                key = self.key_idx.to_bytes(
-                    4, 'big') + self.av.key_gen.get_key().tobytes()
-                self.key_idx += 1
-
-                await self.av.key_queue[self.cls.user_id]
-                [self.namespace].put(key)
-
-                await asyncio.sleep(1)
-
-        Thread(target=asyncio.run, args=(gen_keys(),)).start()
-
-    def on_message(self, user_id, msg):
-        super().on_message(user_id, msg)
+    def send(self, packet):
+        self.cls.send_packet(packet, namespace=self.namespace)
 
 # endregion
 
@@ -125,55 +109,105 @@ class KeyClientNamespace(AVClientNamespace):
 # region --- Audio ---
 
 class AudioClientNamespace(AVClientNamespace):
+    CAPTURE_TIMEOUT = 0.1  # seconds; bounds how long stopping can take
 
     def on_connect(self):
         super().on_connect()
-        audio = pyaudio.PyAudio()
-        self.stream = audio.open(format=pyaudio.paInt16, channels=1,
-                                 rate=self.av.sample_rate, output=True,
-                                 frames_per_buffer=self.av.frames_per_buffer)
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1,
+                                      rate=self.av.sample_rate, output=True,
+                                      frames_per_buffer=self.av.frames_per_buffer)
         self.stream.start_stream()
+        self.capture = None
+
+        with AudioCodecFactory() as factory:
+            self.codec = factory.create_audio_codec(
+                self.av.audio_codec, self.av.sample_rate,
+                self.av.frames_per_buffer, self.av.audio_bitrate)
+        # Whatever the peer sends, PCM can always be played. Decoding
+        # happens at playout, in sequence order; see `JitterBuffer`.
+        self.decoders = {codec.flags: codec
+                         for codec in (PCMCodec(), self.codec)}
+
+        self.jitter = JitterBuffer(
+            self.av.frames_per_buffer * 2,
+            1000 * self.av.frames_per_buffer / self.av.sample_rate)
+
+        def play_audio():
+            # Blocking write paces playout at the device rate
+            self.stream.write(
+                self.jitter.pop(), num_frames=self.av.frames_per_buffer,
+                exception_on_underflow=False)
 
-        async def send_audio():
-            await asyncio.sleep(2)
-            audio = pyaudio.PyAudio()
-            stream = audio.open(format=pyaudio.paInt16, channels=1,
-                                rate=self.av.sample_rate, input=True,
-                                frames_per_buffer=self.av.frames_per_buffer)
+        self.av.scheduler.add(self.playout, MediaTask(
+            self.playout, play_audio, Priority.AUDIO))
+        self.av.scheduler.start(self.playout)
 
-            while True:
-                cur_key_idx, key = self.av.key
+        def open_input():
+            self.capture = AudioCapture(
+                self.audio, self.av.sample_rate,
+                self.av.frames_per_buffer).open()
 
-                data = stream.read(self.av.frames_per_buffer,
-                                   exception_on_overflow=False)
+        def send_audio():
+            # Returns as soon as the capture callback completes a frame
+            data = self.capture.read(timeout=self.CAPTURE_TIMEOUT)
+            if data is None:
+                return
 
-                if self.av.encryption is not None:
-                    data = self.av.encryption.encrypt(data, key)
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
-                await asyncio.sleep(self.av.audio_wait)
+            data = self.codec.encode(data)
 
-        Thread(target=asyncio.run, args=(send_audio(),)).start()
+            current = self.av.key
+            if current is None:
+                return  # Out of key material; the call is ending
+            cur_key_idx, key = current
+            if self.av.encryption is not None:
+                data = self.av.encryption.encrypt(data, key, cur_key_idx)
+            self.send(self.writer.pack(data, cur_key_idx, self.codec.flags))
 
-    def on_message(self, user_id, msg):
-        super().on_message(user_id, msg)
+        def close_input():
+            if self.capture is not None:
+                self.capture.close()
+                self.capture = None
 
-        async def handle_message():
-            if user_id == self.cls.user_id:
-                return
+        self.av.scheduler.add(self.namespace, MediaTask(
+            self.namespace, send_audio, Priority.AUDIO,
+            setup=open_input, teardown=close_input))
+        self.av.scheduler.start(self.namespace, delay=2)
 
-            cur_key_idx, key = self.av.key
+    @property
+    def playout(self):
+        return self.namespace + '/playout'
 
-            if (int.from_bytes(msg[:4], 'big') != cur_key_idx):
-                return
-            data = msg[4:]
+    def on_disconnect(self):
+        self.av.scheduler.stop(self.namespace)
+        self.av.scheduler.stop(self.playout)
+        logger.info(f"Audio jitter buffer stats: {self.jitter.stats()}")
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
 
-            data = self.av.encryption.decrypt(data, key)
+    def on_message(self, msg):
+        super().on_message(msg)
+        self.cls.loop.submit(self.handle_message, msg)
 
-            self.stream.write(
-                data, num_frames=self.av.frames_per_buffer,
-                exception_on_underflow=False)
+    async def handle_message(self, msg):
+        packet = unpack(msg)
+        if packet.stream_id == self.writer.stream_id:
+            return
+
+        key = self.av.keys.get(packet.key_idx)
+        if key is None:
+            return
+
+        decoder = self.decoders.get(packet.flags & Flags.OPUS)
+        if decoder is None:
+            return  # Not negotiated; see `negotiate_audio_codec`
+
+        data = self.av.encryption.decrypt(packet.payload, key, packet.key_idx)
 
-        asyncio.run(handle_message())
+        # Decoded and played out by the playout task; see `JitterBuffer`
+        self.jitter.push(packet.seq, packet.timestamp, bytes(data), decoder,
+                         packet.stream_id)
 
 # endregion
 
@@ -181,68 +215,294 @@ class AudioClientNamespace(AVClientNamespace):
 # region --- Video ---
 
 class VideoClientNamespace(AVClientNamespace):
+    QUEUE_SIZE = 2  # Per pipeline queue
 
     def on_connect(self):
         super().on_connect()
-        inpipe = ffmpeg.input('pipe:')
-        self.output = ffmpeg.output(
-            inpipe, 'pipe:', format='rawvideo', pix_fmt='rgbx')
-
-        async def send_video():
-            await asyncio.sleep(2)
-            cap = cv2.VideoCapture(0)
-
-            inpipe = ffmpeg.input(
-                'pipe:',
-                format='rawvideo',
-                pix_fmt='rgbx',
-                s='{}x{}'.format(
-                    self.av.video_shape[1], self.av.video_shape[0]),
-                r=self.av.frame_rate,
-            )
-
-            output = ffmpeg.output(
-                inpipe, 'pipe:', vcodec='libx264', f='ismv',
-                preset='ultrafast', tune='zerolatency')
-
-            while True:
-                cur_key_idx, key = self.av.key
-
-                _, image = cap.read()
-                image = cv2.resize(
-                    image, (self.av.video_shape[1], self.av.video_shape[0]))
-                data = image.tobytes("hex", "rgb")
-
-                data = output.run(
-                    input=data, capture_stdout=True, quiet=True)[0]
-
-                data = self.av.encryption.encrypt(data, key)
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
-
-                await asyncio.sleep(1 / self.av.frame_rate / 5)
-
-        Thread(target=asyncio.run, args=(send_video(),)).start()
-
-    def on_message(self, user_id, msg):
-        super().on_message(user_id, msg)
-
-        async def handle_message():
-            if user_id == self.cls.user_id:
+        self.decoders = {}
+        self.resync = set()  # stream_ids skipping to their next keyframe
+        self.pipeline = None
+        self.lock = threading.Lock()  # Held while (re)starting the pipeline
+
+        # Outgoing quality follows our own load and what peers report;
+        # the configured shape and frame rate are the ceiling.
+        ceiling = self.av.video_shapes.index(self.av.video_shape)
+        self.controller = VideoController(
+            self.av.video_shapes[:ceiling + 1],
+            [rate for rate in self.av.frame_rates
+             if rate <= self.av.frame_rate])
+        self.level = self.controller.level
+        self.dropped = 0  # Pipeline drops already seen by the controller
+        self.reception = {}  # stream_id -> ReceptionStats
+        # Reports are numbered apart from video, which another thread sends
+        self.feedback_writer = PacketWriter(
+            get_stream_id(self.cls.user_id, self.namespace + '/feedback'))
+
+        self.av.scheduler.add(self.namespace, MediaTask(
+            self.namespace, priority=Priority.VIDEO,
+            setup=self.start_video, teardown=self.stop_video))
+        self.av.scheduler.start(self.namespace, delay=2)
+
+        def adapt():
+            if task.sleep(self.controller.interval):
                 return
-            cur_key_idx, key = self.av.key
-
-            if (int.from_bytes(msg[:4], 'big') != cur_key_idx):
+            current = self.av.key
+            if current is None:
                 return
+            cur_key_idx, key = current
+            for stats in list(self.reception.values()):
+                self.send(self.feedback_writer.pack(
+                    sign_feedback(stats.report(), key), cur_key_idx,
+                    Flags.FEEDBACK))
+            self.adapt()
+
+        task = self.av.scheduler.add(self.adaptation, MediaTask(
+            self.adaptation, adapt, Priority.VIDEO))
+        self.av.scheduler.start(self.adaptation, delay=2)
+
+    @property
+    def adaptation(self):
+        return self.namespace + '/adapt'
+
+    def start_video(self):
+        with self.lock:
+            shape, frame_rate, _ = self.level
+            # Frames are reserved while captured, queued and encoded;
+            # see `FramePool`
+            pool_size = self.QUEUE_SIZE + 2
+            if self.av.video_device is None:
+                self.camera = SyntheticSource(shape, frame_rate, pool_size)
+            else:
+                self.camera = CameraSource(
+                    self.av.video_device, shape, frame_rate, pool_size)
+            self.camera.open()
+            self.start_stream()
+
+    def stop_video(self):
+        with self.lock:
+            if self.pipeline is not None:
+                self.stop_stream()
+                self.camera.close()
+
+    def start_stream(self):
+        """
+        Encode and send frames from the open camera at the current level.
+        """
+        shape, frame_rate, bitrate = self.level
+        self.encoder = EncoderSession(
+            shape, frame_rate, bitrate=bitrate).open()
+
+        def capture():
+            frame = self.camera.read()
+            if frame is not None:
+                # Stamped here, so receivers' queueing delay includes any
+                # backlog on this side
+                return now_ms(), frame
+
+        def release(item):
+            self.camera.release(item[1])
+
+        def encode(item):
+            timestamp, image = item
+            # Written to the encoder's stdin without an extra copy; blocks
+            # while the encoder falls behind or its output isn't taken.
+            # A frame still waiting after `POLL` is dropped, as newer ones
+            # are queued by then.
+            start = time.perf_counter()
+            try:
+                self.encoder.encode(memoryview(image), timeout=Worker.POLL,
+                                    timestamp=timestamp)
+            finally:
+                # ffmpeg has the bytes now; the buffer can be reused
+                self.camera.release(image)
+            self.controller.on_encode(time.perf_counter() - start)
+
+        def encrypt(unit):
+            current = self.av.key
+            if current is None:
+                return None
+            cur_key_idx, key = current
+            flags = Flags.KEYFRAME if is_keyframe(unit.data) else Flags.NONE
+            data = self.av.encryption.encrypt(unit.data, key, cur_key_idx)
+            return self.writer.pack(data, cur_key_idx, flags, unit.timestamp)
+
+        # capture -> encode -> (encoder) -> encrypt -> transmit
+        # Only raw frames may be dropped: losing an encoded P-frame
+        # would corrupt the picture until the next keyframe, so past
+        # the encoder a slow stage holds back the ones before it.
+        self.pipeline = Pipeline(
+            maxsize=self.QUEUE_SIZE, priority=Priority.VIDEO)
+        frames = self.pipeline.queue('frames', on_drop=release)
+        packets = self.pipeline.queue('packets', lossless=True)
+        outgoing = self.pipeline.queue('outgoing', lossless=True)
+        self.pipeline.source('capture', capture, frames)
+        self.pipeline.stage('encode', encode, frames)
+        self.pipeline.source('encoded', lambda: self.encoder.read(
+            timeout=Worker.POLL), packets)
+        self.pipeline.stage('encrypt', encrypt, packets, outgoing)
+        self.pipeline.stage('transmit', self.send, outgoing)
+        self.pipeline.start()
+        self.dropped = 0
+
+    def stop_stream(self):
+        self.pipeline.stop()
+        self.encoder.close()
+        # Captured but never encoded; the camera stays open
+        frames = self.pipeline.queues['frames']
+        while not frames.empty():
+            self.camera.release(frames.get_nowait()[1])
+        self.pipeline = None
+
+    def adapt(self):
+        """
+        Let the controller judge the last interval and, if it picks a new
+        level, switch to it: the open camera is rescaled and decimated in
+        place and only the encoder is restarted. The new encoder opens
+        with a keyframe, so receivers switch over cleanly. If the switch
+        fails, the previous level is restored, or failing that the camera
+        is closed.
+        """
+        with self.lock:
+            if self.pipeline is None:
+                return
+            dropped = sum(queue['dropped']
+                          for queue in self.pipeline.stats().values())
+        change = self.controller.evaluate(dropped - self.dropped)
+        self.dropped = dropped
+        if change is None:
+            return
+
+        previous = self.level
+        self.level, reason = change
+        logger.info(f"Video now {self.level.shape[1]}x{self.level.shape[0]}"
+                    f" at {self.level.frame_rate} fps, "
+                    f"{self.level.bitrate // 1000} kbit/s ({reason}).")
+        with self.lock:
+            if self.pipeline is None:
+                return  # Stopped meanwhile; starts at the new level
+            self.stop_stream()
+            try:
+                self.restart_stream()
+                return
+            except Exception as e:
+                logger.error(f"Video failed to switch level: {e}")
+            self.level = previous
+            self.controller.restore(previous)
+            try:
+                self.restart_stream()
+            except Exception as e:
+                logger.error(f"Video failed to restart; closing camera: {e}")
+                self.camera.close()
+
+    def restart_stream(self):
+        """
+        Resume streaming from the open camera at the current level. Leaves
+        nothing running if it fails.
+        """
+        self.camera.reconfigure(self.level.shape, self.level.frame_rate)
+        try:
+            self.start_stream()
+        except Exception:
+            self.encoder.close()
+            self.pipeline = None
+            raise
 
-            data = self.av.encryption.decrypt(msg[4:], key)
-
-            # Data is now an ISMV format file in memory
-            data = self.output.run(input=data, capture_stdout=True,
-                                   quiet=True)[0]
-
-            super().frontend_socket.emit(data, {'type': 'stream'})
-
-        asyncio.run(handle_message())
+    def on_disconnect(self):
+        self.av.scheduler.stop(self.adaptation)
+        self.av.scheduler.stop(self.namespace)
+        logger.info(f"Video ended at {self.level} after "
+                    f"{self.controller.changes} quality changes.")
+        for decoder in self.decoders.values():
+            decoder.close()
+        self.decoders = {}
+
+    def get_decoder(self, stream_id):
+        """
+        Return the resident decoder for `stream_id`, starting one on first use
+        and again if the last one exited (e.g. on a corrupt bitstream).
+        """
+        decoder = self.decoders.get(stream_id)
+        if decoder is not None and not decoder.is_open:
+            logger.error(f"Video decoder for stream {stream_id} exited "
+                         f"({decoder.process.returncode}); restarting it.")
+            decoder.close()
+            decoder = None
+            # Nothing decodes until the next keyframe anyway
+            self.resync.add(stream_id)
+        if decoder is None:
+            # Scaled to a fixed size whatever level the peer sends at
+            decoder = DecoderSession(
+                self.av.receive_shape, self.on_frame, pix_fmt='rgb0').open()
+            self.decoders[stream_id] = decoder
+        return decoder
+
+    def on_frame(self, frame):
+        self.frontend_socket.emit('stream', frame.tobytes())
+
+    def on_message(self, msg):
+        super().on_message(msg)
+        self.cls.loop.submit(self.handle_message, msg)
+
+    async def handle_message(self, msg):
+        packet = unpack(msg)
+        if packet.stream_id in (self.writer.stream_id,
+                                self.feedback_writer.stream_id):
+            return
+
+        if packet.flags & Flags.FEEDBACK:
+            self.on_feedback(packet)
+            return
+
+        if packet.stream_id not in self.reception:
+            self.reception[packet.stream_id] = ReceptionStats(
+                packet.stream_id)
+        self.reception[packet.stream_id].on_packet(
+            packet.seq, packet.timestamp)
+
+        key = self.av.keys.get(packet.key_idx)
+        if key is None:
+            return
+
+        # Once decoding falls behind, drop frames rather than queue them.
+        # Later frames are predicted from the dropped ones, so skip until
+        # the next keyframe.
+        if self.cls.loop.lane_full(self.namespace):
+            if packet.stream_id not in self.resync:
+                logger.info(f"Video decoding fell behind; skipping stream "
+                            f"{packet.stream_id} to its next keyframe.")
+            self.resync.add(packet.stream_id)
+            return
+        if packet.stream_id in self.resync:
+            if not packet.flags & Flags.KEYFRAME:
+                return
+            self.resync.discard(packet.stream_id)
+
+        data = self.av.encryption.decrypt(packet.payload, key, packet.key_idx)
+
+        # Data is now a raw H.264 access unit. Starting a decoder and
+        # writing to its pipe block, so they run off the message loop.
+        await self.cls.loop.run_blocking(
+            self.namespace, self.decode, packet.stream_id, data,
+            bool(packet.flags & Flags.KEYFRAME))
+
+    def on_feedback(self, packet):
+        key = self.av.keys.get(packet.key_idx)
+        if key is None:
+            return
+        feedback = unpack_feedback(packet.payload, key)
+        if feedback is None:
+            logger.warning("Dropped video feedback with a bad tag.")
+            return
+        if feedback.stream_id == self.writer.stream_id:
+            self.controller.on_feedback(feedback)
+
+    def decode(self, stream_id, data, keyframe):
+        decoder = self.get_decoder(stream_id)
+        if stream_id in self.resync:  # Decoder was just restarted
+            if not keyframe:
+                return
+            self.resync.discard(stream_id)
+        decoder.decode(data)
 
 # endregion
 
@@ -252,49 +512,78 @@ class VideoClientNamespace(AVClientNamespace):
 
 class AV:
     namespaces = {
-        # '/video_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
-        # '/audio_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
         '/video': (BroadcastFlaskNamespace, VideoClientNamespace),
         '/audio': (BroadcastFlaskNamespace, AudioClientNamespace),
     }
 
     def __init__(self, cls, frontend_socket: socketio.Client,
-                 encryption: EncryptSchemes.ABSTRACT = EncryptFactory().create_encrypt_scheme(EncryptSchemes.AES)):
+                 encryption: EncryptSchemes.ABSTRACT = EncryptFactory().create_encrypt_scheme(EncryptSchemes.AESCTR),
+                 key_epoch=None, key_offset=0, peer_audio_codecs=None):
 
         self.cls = cls
 
-        self.key_gen = KeyGenFactory().create_key_generator(KeyGenerators.FILE)
-        self.key_gen.generate_key(key_length=128)
-
         display_shapes = [(720, 960, 3), (720, 1280, 3)]
         self.display_shape = display_shapes[0]
-        video_shapes = [(120, 160, 3), (240, 320, 3),
-                        (480, 640, 3), (720, 960, 3), (1080, 1920, 3)]
-        self.video_shape = video_shapes[2]
-        self.frame_rate = 15
-
-        sample_rates = [8196, 44100]
-        self.sample_rate = sample_rates[0]
-        self.frames_per_buffer = self.sample_rate // 6
-        self.audio_wait = 1 / 8
-
-        self.key = self.key_gen.get_key().tobytes()
+        self.video_shapes = [(120, 160, 3), (240, 320, 3),
+                             (480, 640, 3), (720, 960, 3), (1080, 1920, 3)]
+        self.frame_rates = [5, 10, 15]
+        # Upper bound for outgoing video; see `VideoController`
+        self.video_shape = self.video_shapes[2]
+        self.frame_rate = self.frame_rates[2]
+        # Incoming video is decoded at this size whatever the peer sends
+        self.receive_shape = self.video_shapes[2]
+        # OpenCV camera index; `None` sends a synthetic test pattern
+        self.video_device = 0
+
+        # Opus is only sent if both peers advertised it at /peer_connection
+        self.audio_codec = negotiate_audio_codec(
+            AudioCodecs.OPUS, peer_audio_codecs)
+        self.audio_bitrate = 32000  # Opus only
+        sample_rates = [8196, 16000, 44100, 48000]
+        # Raw PCM at 48 kHz would be 768 kbit/s; at 16 kHz it is 256 kbit/s.
+        # Both peers negotiate the same codec, so they agree on the rate.
+        if self.audio_codec == AudioCodecs.OPUS:
+            self.sample_rate = sample_rates[3]
+        else:
+            self.sample_rate = sample_rates[1]
+        # Audio is captured, sent and played in frames of this duration
+        self.audio_frame_ms = 20
+        self.frames_per_buffer = self.sample_rate * self.audio_frame_ms // 1000
+
+        # Both peers derive keys from the epoch and key file offset agreed
+        # at /peer_connection; see `KeySchedule`.
+        self.keys = KeySchedule(
+            key_epoch if key_epoch is not None else time.time(),
+            offset=key_offset, key_length=128)
+        self.ended = threading.Event()
 
         self.encryption: EncryptSchemes.ABSTRACT = encryption
 
+        # Owns every capture/playback task; see `MediaScheduler`
+        self.scheduler = MediaScheduler()
+
         self.client_namespaces = generate_client_namespace(
             cls, self, frontend_socket)
 
-        async def gen_keys():
-            key_idx = 0
-            while True:
-                self.key_gen.generate_key(key_length=128)
-                self.key = key_idx, self.key_gen.get_key().tobytes()
-                key_idx += 1
-
-                await asyncio.sleep(1)
-
-        Thread(target=asyncio.run, args=(gen_keys(),)).start()
+    @property
+    def key(self):
+        """
+        `(key_idx, key)` currently in force, or `None` once the key file
+        has run out, which ends the call.
+        """
+        try:
+            return self.keys.current()
+        except KeyMaterialExhausted as e:
+            self.end_call(e)
+            return None
+
+    def end_call(self, reason):
+        if self.ended.is_set():
+            return
+        self.ended.set()
+        logger.error(f"Ending call: {reason}")
+        # Disconnecting stops the media threads, so not from one of them
+        threading.Thread(target=self.cls.disconnect, daemon=True).start()
 
 # endregion
 
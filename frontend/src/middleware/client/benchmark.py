@@ -0,0 +1,48 @@
+"""
+Micro-benchmarks for the media hot path.
+
+Run from `src/middleware` with `python -m client.benchmark`.
+"""
+import os
+import timeit
+
+from bitarray import bitarray
+
+from client.encryption import XOREncryption
+
+# region --- Encryption ---
+
+
+def legacy_xor(data, key):
+    """Bit-by-bit XOR as originally implemented by `XOREncryption`."""
+    result = bitarray()
+    for bit1, bit2 in zip(data, key):
+        result.append(bit1 ^ bit2)
+    return result
+
+
+def bench_xor(sizes=(1024, 16 * 1024, 128 * 1024), number=5):
+    scheme = XOREncryption()
+    for size in sizes:
+        data, key = os.urandom(size), os.urandom(size)
+        out = bytearray(size)
+
+        data_bits, key_bits = bitarray(), bitarray()
+        data_bits.frombytes(data)
+        key_bits.frombytes(key)
+        assert legacy_xor(data_bits, key_bits).tobytes() == \
+            bytes(scheme.encrypt(data, key))
+
+        legacy = timeit.timeit(
+            lambda: legacy_xor(data_bits, key_bits), number=number) / number
+        vectorised = timeit.timeit(
+            lambda: scheme.encrypt(data, key, out=out), number=number) / number
+        print(f"XOR {size // 1024:>4} KiB: legacy {legacy * 1e3:9.3f} ms, "
+              f"vectorised {vectorised * 1e3:7.3f} ms "
+              f"({legacy / vectorised:,.0f}x)")
+
+# endregion
+
+
+if __name__ == "__main__":
+    bench_xor()
@@ -0,0 +1,130 @@
+import numpy as np
+import pyaudio
+
+from threading import Event
+
+# region --- Ring Buffer ---
+
+
+class SampleRing:
+    """
+    Single-producer single-consumer ring buffer of int16 samples.
+
+    The producer (an audio callback) only advances `written` and the
+    consumer only advances `consumed`, so neither side takes a lock; the
+    counters grow without bound and are reduced modulo the capacity when
+    indexing. When full, new samples are dropped and counted as overruns
+    rather than blocking the audio thread.
+
+    Parameters
+    ----------
+    capacity : int
+        In samples.
+    """
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.written = 0
+        self.consumed = 0
+        self.overruns = 0
+        self.ready = Event()
+
+    def available(self):
+        return self.written - self.consumed
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity - self.available():
+            self.overruns += 1
+            return
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:n - first] = samples[first:]
+        self.written += n
+        self.ready.set()
+
+    def read_into(self, out, timeout=None):
+        """
+        Fill `out` with the oldest samples, waiting up to `timeout` seconds
+        for enough to arrive. Return `False` on timeout.
+        """
+        n = len(out)
+        while self.available() < n:
+            self.ready.clear()
+            if self.available() >= n:
+                break
+            if not self.ready.wait(timeout):
+                return False
+        start = self.consumed % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:n - first]
+        self.consumed += n
+        return True
+
+# endregion
+
+
+# region --- Capture ---
+
+
+class AudioCapture:
+    """
+    Callback-driven microphone capture.
+
+    PortAudio delivers `frame_size` samples at a time on its own thread
+    into a `SampleRing`; `read()` hands out one frame as soon as it is
+    complete, so capture adds no more latency than one frame.
+
+    Parameters
+    ----------
+    audio : pyaudio.PyAudio
+    sample_rate : int
+    frame_size : int
+        Samples per frame, e.g. 10-20 ms worth.
+    depth : int, optional
+        Frames the ring can hold before capture starts dropping.
+    """
+
+    def __init__(self, audio, sample_rate, frame_size, depth=8):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.ring = SampleRing(frame_size * depth)
+        self.frame = np.zeros(frame_size, dtype=np.int16)
+        self.stream = None
+
+    def open(self):
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16, channels=1, rate=self.sample_rate,
+            input=True, frames_per_buffer=self.frame_size,
+            stream_callback=self.callback)
+        self.stream.start_stream()
+        return self
+
+    def callback(self, in_data, frame_count, time_info, status):
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return None, pyaudio.paContinue
+
+    def read(self, timeout=None):
+        """
+        Return the next frame as bytes, or `None` if none is complete
+        within `timeout` seconds.
+        """
+        if not self.ring.read_into(self.frame, timeout):
+            return None
+        return self.frame.tobytes()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+# endregion
@@ -1,10 +1,17 @@
 import requests
 import socketio
+import time
+
+from threading import Event
 
 from client.api import ClientAPI
+from client.audio_codec import available_audio_codecs
 from client.av import AV
+from client.encryption import persisted_offset
 from client.endpoint import Endpoint
 from client.errors import Errors
+from client.loop import MessageLoop
+from client.transport import MediaTransports
 from client.util import get_parameters, ClientState
 from custom_logging import logger
 
@@ -15,11 +22,14 @@ from custom_logging import logger
 class SocketClient():  # Not threaded because sio.connect() is not blocking
 
     sio = socketio.Client()
+    connected = Event()
     user_id = None
     endpoint = None
     instance = None
     namespaces = None
     av = None
+    loop = None
+    direct = None
     video = {}
     display_message = None
 
@@ -27,6 +37,14 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
     def is_connected(cls):
         return cls.sio.connected
 
+    @classmethod
+    def wait_until_connected(cls, timeout=None):
+        """
+        Block until the socket connection is established.
+        Return `True` iff it was established within `timeout` seconds.
+        """
+        return cls.connected.wait(timeout)
+
     def HandleExceptions(endpoint_handler):
         """
         Decorator to handle commonly encountered
@@ -48,15 +66,22 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
 
     @classmethod
     # TODO: Unsure if client needed.
-    def init(cls, endpoint, user_id,
-             display_message, frontend_socket):
+    def init(cls, endpoint, user_id, display_message, frontend_socket,
+             key_epoch, key_offset=0, direct=None, peer_audio_codecs=None):
         logger.info(
             f"Initiailizing Socket Client with WebSocket endpoint {endpoint}.")
 
-        cls.av = AV(cls, frontend_socket)
+        cls.user_id = user_id
+        cls.loop = MessageLoop()
+        cls.loop.start()
+        cls.av = AV(cls, frontend_socket, key_epoch=key_epoch,
+                    key_offset=key_offset,
+                    peer_audio_codecs=peer_audio_codecs)
         cls.namespaces = cls.av.client_namespaces
+        cls.direct = direct
+        if direct is not None:
+            direct.on_packet = cls.receive_packet
         cls.endpoint = Endpoint(*endpoint)
-        cls.user_id = user_id
         cls.display_message = display_message
         cls.instance = cls()
         return cls.instance
@@ -72,6 +97,21 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
         cls.sio.send(((str(cls.user_id), ), msg),
                      namespace=namespace)
 
+    @classmethod
+    def send_packet(cls, packet: bytes, namespace):
+        """
+        Send a framed media packet, directly to the peer if a direct link
+        is up and otherwise through the relay as one binary attachment.
+        """
+        if cls.direct is not None and cls.direct.send(namespace, packet):
+            return
+        cls.sio.send(packet, namespace=namespace)
+
+    @classmethod
+    def receive_packet(cls, namespace, packet):
+        """Deliver a packet received on the direct link."""
+        cls.namespaces[namespace].on_message(packet)
+
     @classmethod
     def connect(cls):
         logger.info(f"Attempting WebSocket connection to {cls.endpoint}.")
@@ -89,6 +129,16 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
         # Check to make sure we're actually connected
         logger.info("Disconnecting Socket Client from Websocket API.")
         cls.sio.disconnect()
+        if cls.av is not None:
+            cls.av.scheduler.stop_all()
+        if cls.direct is not None:
+            logger.info(f"Direct media link stats: {cls.direct.stats()}")
+            cls.direct.close()
+            cls.direct = None
+        if cls.loop is not None:
+            logger.info(f"Message loop stats: {cls.loop.stats()}")
+            cls.loop.stop()
+            cls.loop = None
         # Make sure to update state, delete instance if necessary, etc.
 
     @classmethod
@@ -108,6 +158,13 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
         ns = sorted(list(cls.namespaces.keys()))
         for name in ns:
             cls.namespaces[name].on_connect()
+        cls.connected.set()
+
+    @sio.on('disconnect')
+    @HandleExceptions
+    def on_disconnect(cls):
+        logger.info("Socket connection closed.")
+        cls.connected.clear()
 
     @sio.on('message')
     @HandleExceptions
@@ -123,6 +180,10 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
 
 
 class Client:
+    PEER_CONNECTION_TIMEOUT = 10  # seconds
+    # Peer-to-peer media link to offer; `None` always uses the relay
+    MEDIA_TRANSPORT = MediaTransports.UDP
+
     def __init__(self, frontend_socket, server_endpoint=None,
                  api_endpoint=None, websocket_endpoint=None):
         logger.info(f"""Initializing Client with:
@@ -262,31 +323,92 @@ class Client:
         """
         logger.info(
             f"Attempting to initiate connection to peer User {peer_id}.")
+        start = time.perf_counter()
+        # Shared key schedule; forwarded to the peer by the server. The
+        # peer replies with the offset to use, past what either has used.
+        key_epoch, key_offset = time.time(), persisted_offset()
+        direct, media_endpoint = self.offer_direct_media()
+        media_transport = direct and self.MEDIA_TRANSPORT.name
         try:
             response = self.contact_server('/peer_connection', json={
                 'user_id': self.user_id,
                 'peer_id': peer_id,
+                'key_epoch': key_epoch,
+                'key_offset': key_offset,
+                'media_endpoint': media_endpoint and tuple(media_endpoint),
+                'media_transport': media_transport,
+                'audio_codecs': available_audio_codecs(),
             })
         except Errors.CONNECTIONREFUSED.value as e:
             logger.error(str(e))
+            if direct is not None:
+                direct.close()
             raise e
         except Errors.UNEXPECTEDRESPONSE.value as e:
             logger.error(str(e))
+            if direct is not None:
+                direct.close()
             raise e
 
         websocket_endpoint = get_parameters(
             response.json(), 'socket_endpoint')
         logger.info(f"Received websocket endpoint '{
             websocket_endpoint}'.")
-        self.connect_to_websocket(websocket_endpoint)
-        while True:
-            if SocketClient.is_connected():
-                break
+        # Missing for peers that predate negotiation; they only know PCM
+        peer_audio_codecs = response.json().get('audio_codecs')
+        key_offset = max(key_offset, response.json().get('key_offset') or 0)
+        self.connect_to_websocket(
+            websocket_endpoint, key_epoch, key_offset, direct,
+            peer_audio_codecs)
+        if not SocketClient.wait_until_connected(self.PEER_CONNECTION_TIMEOUT):
+            context = f"Timed out connecting to WebSocket at {
+                websocket_endpoint}."
+            logger.error(context)
+            raise Errors.CONNECTIONREFUSED.value(context)
+        logger.info(f"Connected to peer User {peer_id} in {
+            time.perf_counter() - start:.3f}s.")
 
     def disconnect_from_server(self):
         pass
     # endregion
 
+    # region --- Direct Media ---
+
+    def offer_direct_media(self):
+        """
+        Listen for a direct media link from the peer.
+        Return `(transport, endpoint)`, or `(None, None)` if unavailable.
+        """
+        if self.MEDIA_TRANSPORT is None:
+            return None, None
+        direct = self.MEDIA_TRANSPORT.value(sorted(AV.namespaces))
+        try:
+            endpoint = direct.listen(self.api_endpoint.ip)
+        except OSError as e:
+            logger.error(f"Unable to offer direct media link: {e}")
+            return None, None
+        logger.info(f"Offering direct media link at {endpoint}.")
+        return direct, endpoint
+
+    def accept_direct_media(self, media_endpoint, media_transport):
+        """
+        Connect to the direct media link offered by the peer.
+        Return the transport, or `None` to use the relay.
+        """
+        if self.MEDIA_TRANSPORT is None or media_endpoint is None:
+            return None
+        direct = media_transport.value(sorted(AV.namespaces))
+        try:
+            direct.connect(media_endpoint)
+        except OSError as e:
+            logger.info(f"Direct media link to {media_endpoint} failed "
+                        f"({e}); using relay.")
+            return None
+        logger.info(f"Direct {media_transport.name} media link established "
+                    f"to {media_endpoint}.")
+        return direct
+    # endregion
+
     # region --- Client API Handlers ---
 
     def start_api(self):
@@ -298,7 +420,10 @@ class Client:
         self.api_instance.start()
 
     # TODO: Return case for failed connections
-    def handle_peer_connection(self, peer_id, socket_endpoint):
+    def handle_peer_connection(self, peer_id, socket_endpoint,
+                               key_epoch, key_offset=0, media_endpoint=None,
+                               media_transport=MediaTransports.TCP,
+                               audio_codecs=None):
         """
         Initialize Socket Client and attempt
         connection to specified Socket API endpoint.
@@ -306,7 +431,18 @@ class Client:
 
         Parameters
         ----------
-
+        peer_id : str
+        socket_endpoint : Endpoint
+        key_epoch : float
+            Start time of the key schedule chosen by the peer.
+        key_offset : int, optional
+            Key file offset of the schedule; see `KeySchedule`.
+        media_endpoint : Endpoint, optional
+            Direct media link offered by the peer, if any.
+        media_transport : MediaTransports, optional
+            Transport of the offered link.
+        audio_codecs : list of str, optional
+            `AudioCodecs` names the peer can decode.
         """
         if self.state == ClientState.CONNECTED:
             raise Errors.INTERNALCLIENTERROR.value(
@@ -319,7 +455,9 @@ class Client:
             peer_id} at {socket_endpoint}.")
 
         try:
-            self.connect_to_websocket(socket_endpoint)
+            direct = self.accept_direct_media(media_endpoint, media_transport)
+            self.connect_to_websocket(
+                socket_endpoint, key_epoch, key_offset, direct, audio_codecs)
             return True
         except Exception as e:
             logger.error('Warning', f"Connection to incoming peer User {
@@ -331,10 +469,12 @@ class Client:
     # endregion
 
     # region --- Web Socket Interface ---
-    def connect_to_websocket(self, endpoint):
+    def connect_to_websocket(self, endpoint, key_epoch, key_offset=0,
+                             direct=None, peer_audio_codecs=None):
         sio = SocketClient.init(
             endpoint, self.user_id,
-            self.display_message, self.frontend_socket)
+            self.display_message, self.frontend_socket,
+            key_epoch, key_offset, direct, peer_audio_codecs)
         try:
             sio.start()
         except Exception as e:
@@ -0,0 +1,435 @@
+import ffmpeg
+import numpy as np
+import os
+import queue
+
+from collections import deque
+from threading import Semaphore, Thread
+from typing import NamedTuple
+
+# region --- Utils ---
+
+START_CODE = b'\x00\x00\x00\x01'
+# Annex B access unit delimiter NAL (type 9, any picture type). Starts
+# every access unit `EncoderSession` returns.
+AUD = START_CODE + b'\x09\xf0'
+
+READ_SIZE = 1 << 16
+
+# The encoder's output is framed as FLV, whose tags carry their length,
+# so each frame is complete as soon as its tag is. Raw H.264 only shows
+# where a frame ends once the next one starts.
+FLV_HEADER_SIZE = 9 + 4  # File header and the first PreviousTagSize
+FLV_TAG_HEADER_SIZE = 11
+FLV_TAG_TRAILER_SIZE = 4  # PreviousTagSize
+FLV_VIDEO = 9
+FLV_KEYFRAME = 1
+FLV_AVC_SEQUENCE_HEADER = 0
+FLV_AVC_NALU = 1
+
+# No progress stats on stderr, which sessions leave attached to ours
+FFMPEG_QUIET = ('-nostats', '-loglevel', 'error')
+
+PIX_FMT_CHANNELS = {
+    'gray': 1,
+    'rgb24': 3,
+    'bgr24': 3,
+    'rgb0': 4,
+    'rgba': 4,
+    'bgra': 4,
+}
+
+
+def split_flv_tags(buffer: bytearray):
+    """
+    Pop every complete FLV tag off the front of `buffer`, which starts at
+    a tag. Returns `(tag_type, data)` pairs; a partial tag is left.
+    """
+    tags = []
+    start = 0
+    while len(buffer) - start >= FLV_TAG_HEADER_SIZE:
+        size = int.from_bytes(buffer[start + 1:start + 4], 'big')
+        data = start + FLV_TAG_HEADER_SIZE
+        end = data + size + FLV_TAG_TRAILER_SIZE
+        if end > len(buffer):
+            break
+        tags.append((buffer[start], bytes(buffer[data:data + size])))
+        start = end
+    del buffer[:start]
+    return tags
+
+
+class FlvVideoParser:
+    """
+    Turns the H.264 video tags of an FLV stream into Annex B access units.
+
+    FLV carries NAL units length-prefixed and the SPS/PPS once, in the
+    sequence header. Each access unit returned starts with an `AUD`, and
+    keyframes carry the SPS/PPS in-band, so every keyframe can be decoded
+    on its own.
+    """
+
+    def __init__(self):
+        self.parameter_sets = b''
+        self.length_size = 4
+
+    def parse(self, data):
+        """
+        Return the access unit in a video tag's `data`, or `None` for
+        tags without one (e.g. the sequence header).
+        """
+        frame_type, packet_type = data[0] >> 4, data[1]
+        payload = memoryview(data)[5:]  # After the composition time
+        if packet_type == FLV_AVC_SEQUENCE_HEADER:
+            self.configure(payload)
+            return None
+        if packet_type != FLV_AVC_NALU:
+            return None
+
+        parts = [AUD]
+        if frame_type == FLV_KEYFRAME:
+            parts.append(self.parameter_sets)
+        pos = 0
+        while pos + self.length_size <= len(payload):
+            length = int.from_bytes(
+                payload[pos:pos + self.length_size], 'big')
+            pos += self.length_size
+            parts += (START_CODE, payload[pos:pos + length])
+            pos += length
+        return b''.join(parts)
+
+    def configure(self, record):
+        """Read an AVCDecoderConfigurationRecord."""
+        self.length_size = (record[4] & 0x03) + 1
+        parameter_sets = []
+        pos = 5
+        for mask in (0x1F, 0xFF):  # SPS count, then PPS count
+            count = record[pos] & mask
+            pos += 1
+            for _ in range(count):
+                length = int.from_bytes(record[pos:pos + 2], 'big')
+                pos += 2
+                parameter_sets += (START_CODE, record[pos:pos + length])
+                pos += length
+        self.parameter_sets = b''.join(parameter_sets)
+
+
+def is_keyframe(access_unit):
+    """
+    Return `True` iff the access unit contains an IDR slice (NAL type 5).
+    """
+    start = access_unit.find(b'\x00\x00\x01')
+    while 0 <= start < len(access_unit) - 3:
+        if access_unit[start + 3] & 0x1F == 5:
+            return True
+        start = access_unit.find(b'\x00\x00\x01', start + 3)
+    return False
+
+# endregion
+
+
+# region --- Encoder ---
+
+
+class AccessUnit(NamedTuple):
+    data: bytes
+    timestamp: int  # As passed to `EncoderSession.encode()`
+
+
+class EncoderSession:
+    """
+    Long-lived H.264 encoder.
+
+    Keeps a single ffmpeg/libx264 process open for the lifetime of a
+    stream. Raw frames are written to its stdin and encoded access units
+    are collected from stdout by a reader thread, so inter-frame state
+    (P-frames) survives between frames and no process is forked per frame.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width, channels) of the raw input frames.
+    frame_rate : int
+    pix_fmt : str, optional
+        ffmpeg pixel format of the raw input frames.
+    bitrate : int, optional
+        Target bits per second, also used as the rate cap with a one
+        second buffer. `None` leaves rate control to libx264's defaults.
+    max_pending : int, optional
+        Most frames that may be written but not yet read back encoded;
+        see `encode()`.
+    """
+
+    def __init__(self, shape, frame_rate, pix_fmt='bgr24', bitrate=None,
+                 max_pending=2):
+        self.shape = shape
+        self.frame_rate = frame_rate
+        self.pix_fmt = pix_fmt
+        self.bitrate = bitrate
+        self.frame_size = shape[0] * shape[1] * shape[2]
+
+        self.packets = queue.Queue()
+        self.timestamps = deque()  # Of frames not yet encoded, in order
+        # One slot per frame between `encode()` and `read()`
+        self.room = Semaphore(max_pending)
+        self.written = 0
+        self.delivered = 0
+        self.process = None
+        self.reader = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            packet = self.read()
+            if packet is None:
+                return
+            yield packet
+
+    @property
+    def is_open(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def backlog(self):
+        """Frames written that have not been read back encoded."""
+        return self.written - self.delivered
+
+    def open(self):
+        if self.is_open:
+            return self
+
+        inpipe = ffmpeg.input(
+            'pipe:',
+            format='rawvideo',
+            pix_fmt=self.pix_fmt,
+            s='{}x{}'.format(self.shape[1], self.shape[0]),
+            r=self.frame_rate,
+        )
+        rate_control = {}
+        if self.bitrate is not None:
+            rate_control = {'b:v': self.bitrate, 'maxrate': self.bitrate,
+                            'bufsize': self.bitrate}
+        # Each packet is written out as soon as it is encoded; see
+        # `FlvVideoParser`
+        output = ffmpeg.output(
+            inpipe, 'pipe:', vcodec='libx264', f='flv',
+            flush_packets=1, flvflags='no_duration_filesize',
+            preset='ultrafast', tune='zerolatency', pix_fmt='yuv420p',
+            g=self.frame_rate * 2, **rate_control)
+        # stderr is inherited rather than piped: nothing would read a pipe,
+        # and a full one would block ffmpeg. Only errors are printed.
+        self.process = output.global_args(*FFMPEG_QUIET).run_async(
+            pipe_stdin=True, pipe_stdout=True)
+
+        self.reader = Thread(target=self._read_packets, daemon=True)
+        self.reader.start()
+        return self
+
+    def encode(self, frame, timeout=None, timestamp=None):
+        """
+        Queue one raw frame for encoding. Does not wait for the result;
+        encoded access units are returned by `read()`, carrying the
+        frame's `timestamp`.
+
+        Blocks while `max_pending` frames are still unread, so a stalled
+        reader holds back the caller instead of encoded frames piling up
+        here. Returns `False`, without writing the frame, if there is no
+        room after `timeout` seconds.
+        """
+        if not self.is_open:
+            raise BrokenPipeError("Encoder session is not open.")
+        if not self.room.acquire(timeout=timeout):
+            return False
+        self.written += 1
+        self.timestamps.append(timestamp)
+        self.process.stdin.write(frame)
+        self.process.stdin.flush()
+        return True
+
+    def read(self, timeout=None):
+        """
+        Return the next `AccessUnit`, or `None` once the encoder has been
+        closed and drained.
+        """
+        return self._delivered(self.packets.get(timeout=timeout))
+
+    def _delivered(self, packet):
+        if packet is not None:
+            self.delivered += 1
+            self.room.release()
+        return packet
+
+    def drain(self):
+        """
+        Return every `AccessUnit` that is ready without blocking.
+        """
+        packets = []
+        while True:
+            try:
+                packet = self._delivered(self.packets.get_nowait())
+            except queue.Empty:
+                return packets
+            if packet is None:
+                return packets
+            packets.append(packet)
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+        self.process.wait()
+        if self.reader is not None:
+            self.reader.join()
+        self.process = None
+        self.reader = None
+
+    def _read_packets(self):
+        fd = self.process.stdout.fileno()
+        buffer = bytearray()
+        parser = FlvVideoParser()
+        header = FLV_HEADER_SIZE
+        while True:
+            chunk = os.read(fd, READ_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            if header:
+                skipped = min(header, len(buffer))
+                del buffer[:skipped]
+                header -= skipped
+            for tag_type, data in split_flv_tags(buffer):
+                if tag_type != FLV_VIDEO:
+                    continue
+                unit = parser.parse(data)
+                if unit is not None:
+                    self.packets.put(self._stamped(unit))
+
+        self.packets.put(None)
+
+    def _stamped(self, data):
+        # One access unit per frame, in the order frames were written
+        timestamp = self.timestamps.popleft() if self.timestamps else None
+        return AccessUnit(data, timestamp)
+
+# endregion
+
+
+# region --- Decoder ---
+
+
+class DecoderSession:
+    """
+    Long-lived H.264 decoder for a single remote peer.
+
+    Consumes the decrypted bitstream incrementally through one resident
+    ffmpeg process and hands every decoded frame to `on_frame` as a NumPy
+    view over a small pool of reusable buffers, so decode cost scales with
+    bitrate rather than process startup.
+
+    NOTE: A frame view is only valid until `buffers - 1` further frames
+    have been decoded; copy it if it must outlive that.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width, ...) of the decoded frames.
+    on_frame : func
+        Called from the reader thread with each decoded frame.
+    pix_fmt : str, optional
+        ffmpeg pixel format of the decoded frames.
+    buffers : int, optional
+        Number of frame buffers to rotate through.
+    """
+
+    def __init__(self, shape, on_frame, pix_fmt='rgb24', buffers=3):
+        self.shape = (shape[0], shape[1], PIX_FMT_CHANNELS[pix_fmt])
+        self.on_frame = on_frame
+        self.pix_fmt = pix_fmt
+        self.frames = [np.empty(self.shape, dtype=np.uint8)
+                       for _ in range(buffers)]
+
+        self.process = None
+        self.reader = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def is_open(self):
+        return self.process is not None and self.process.poll() is None
+
+    def open(self):
+        if self.is_open:
+            return self
+
+        inpipe = ffmpeg.input(
+            'pipe:', format='h264', flags='low_delay',
+            probesize=32, analyzeduration=0)
+        output = ffmpeg.output(
+            inpipe, 'pipe:', format='rawvideo', pix_fmt=self.pix_fmt,
+            s='{}x{}'.format(self.shape[1], self.shape[0]),
+            fps_mode='passthrough')
+        # See `EncoderSession.open` on stderr
+        self.process = output.global_args(*FFMPEG_QUIET).run_async(
+            pipe_stdin=True, pipe_stdout=True)
+
+        self.reader = Thread(target=self._read_frames, daemon=True)
+        self.reader.start()
+        return self
+
+    def decode(self, access_unit):
+        """
+        Feed the next access unit of the H.264 bitstream.
+
+        ffmpeg's parser only finishes a frame once the next one starts, so
+        a leading `AUD` is moved to the end of the unit: the frame is then
+        decoded now, not when the next access unit arrives.
+        """
+        if not self.is_open:
+            raise BrokenPipeError("Decoder session is not open.")
+        if access_unit.startswith(AUD):
+            access_unit = access_unit[len(AUD):]
+        self.process.stdin.write(access_unit)
+        self.process.stdin.write(AUD)
+        self.process.stdin.flush()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+        self.process.wait()
+        if self.reader is not None:
+            self.reader.join()
+        self.process = None
+        self.reader = None
+
+    def _read_frames(self):
+        stdout = self.process.stdout
+        count = 0
+        while True:
+            frame = self.frames[count % len(self.frames)]
+            view = memoryview(frame).cast('B')
+            got = 0
+            while got < len(view):
+                n = stdout.readinto(view[got:])
+                if not n:
+                    return
+                got += n
+            count += 1
+            self.on_frame(frame)
+
+# endregion
@@ -1,8 +1,14 @@
+import itertools
+import mmap
+import numpy as np
 import os
+import queue
 import string
+import time
 from abc import ABC, abstractmethod
 from bitarray import bitarray
 from enum import Enum
+from threading import Event, Lock, Thread
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 
@@ -11,13 +17,13 @@ from Crypto.Util.Padding import pad, unpad
 
 class AbstractEncryptionScheme(ABC):
     @abstractmethod
-    def encrypt(self, data, key):
-        """Encrypt the data using the provided key."""
+    def encrypt(self, data, key, key_idx=0):
+        """Encrypt the data using the provided key (and its index)."""
         pass
 
     @abstractmethod
-    def decrypt(self, data, key):
-        """Decrypt the data using the provided key."""
+    def decrypt(self, data, key, key_idx=0):
+        """Decrypt the data using the provided key (and its index)."""
         pass
 
     @abstractmethod
@@ -26,25 +32,51 @@ class AbstractEncryptionScheme(ABC):
         pass
 
 
+def as_uint8(buffer):
+    """
+    Return a flat uint8 NumPy view over any contiguous buffer
+    (bytes, bytearray, memoryview, bitarray or ndarray) without copying.
+    """
+    if isinstance(buffer, np.ndarray):
+        return buffer.reshape(-1).view(np.uint8)
+    return np.frombuffer(buffer, dtype=np.uint8)
+
+
 class XOREncryption(AbstractEncryptionScheme):
+    """
+    One-time pad over whole byte buffers.
+
+    `data` and `key` may be any contiguous buffer; `key` must be at least
+    as long as `data`. Bitarray input gives bitarray output, otherwise a
+    bytearray is returned, or the result is written into `out` (a writable
+    buffer of the same length as `data`) if one is given.
+    """
 
     def __init__(self):
         self.name = "XOR"
 
-    # data and key are bit arrays with same length
-    def encrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
-        return result
+    def xor(self, data, key, out=None):
+        data_bits = len(data) if isinstance(data, bitarray) else None
+        data, key = as_uint8(data), as_uint8(key)
+        if len(key) < len(data):
+            raise ValueError("Error, key must be at least as long as data")
+
+        result = bytearray(len(data)) if out is None else out
+        np.bitwise_xor(data, key[:len(data)], out=as_uint8(result))
 
-    # data and key are bit arrays with same length
-    def decrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
+        if data_bits is not None and out is None:
+            bits = bitarray()
+            bits.frombytes(result)
+            del bits[data_bits:]
+            return bits
         return result
 
+    def encrypt(self, data, key, key_idx=0, out=None):
+        return self.xor(data, key, out)
+
+    def decrypt(self, data, key, key_idx=0, out=None):
+        return self.xor(data, key, out)
+
     def get_name(self):
         return self.name
 
@@ -53,10 +85,10 @@ class DebugEncryption(AbstractEncryptionScheme):
     def __init__(self):
         self.name = "Debug"
 
-    def encrypt(self, data, key):
+    def encrypt(self, data, key, key_idx=0):
         return data
 
-    def decrypt(self, data, key):
+    def decrypt(self, data, key, key_idx=0):
         return data
 
     def get_name(self):
@@ -71,7 +103,7 @@ class AESEncryption(AbstractEncryptionScheme):
 
     # data and key are bit arrays
     # using AES-CBC
-    def encrypt(self, data, key):
+    def encrypt(self, data, key, key_idx=0):
         cipher = AES.new(key, AES.MODE_CBC, iv=b'0' * 16)
         data = pad(data, AES.block_size)
         cipheredData = cipher.encrypt(data)
@@ -80,7 +112,7 @@ class AESEncryption(AbstractEncryptionScheme):
 
     # data and key are bit arrays
     # data contains iv and encrypted data
-    def decrypt(self, data, key):
+    def decrypt(self, data, key, key_idx=0):
         iv = b'0' * 16
         cipheredData = data
         cipher = AES.new(key, AES.MODE_CBC, iv)
@@ -93,9 +125,56 @@ class AESEncryption(AbstractEncryptionScheme):
         return self.name
 
 
+class AESCTREncryption(AbstractEncryptionScheme):
+    """
+    AES in counter mode with a fresh nonce per packet.
+
+    No padding is needed, so ciphertext is the plaintext length plus an
+    8-byte header, and every block is independent (parallelisable).
+    The 12-byte nonce is `key_idx || salt || seq`: the key index is already
+    carried by the packet, the random per-sender salt keeps two peers that
+    share a key from reusing a nonce, and `salt || seq` is prepended to the
+    ciphertext so the receiver can rebuild it. The remaining 4 counter
+    bytes allow packets up to 64 GiB.
+
+    pycryptodome's native CTR mode is used directly: building the cipher
+    per packet benchmarks faster than reusing a cached key schedule over
+    NumPy-built counter blocks.
+    """
+    HEADER_SIZE = 8
+
+    def __init__(self, bits=128):
+        self.bits = bits
+        self.name = f"AES-CTR-{bits}"
+        self.salt = os.urandom(4)
+        self.seq = itertools.count()
+
+    def nonce(self, key_idx, header):
+        return key_idx.to_bytes(4, 'big') + header
+
+    # data is bytes, key is the raw AES key
+    def encrypt(self, data, key, key_idx=0):
+        seq = next(self.seq) & 0xFFFFFFFF
+        header = self.salt + seq.to_bytes(4, 'big')
+        cipher = AES.new(key, AES.MODE_CTR,
+                         nonce=self.nonce(key_idx, header))
+        return header + cipher.encrypt(data)
+
+    # data contains the salt/sequence header and encrypted data
+    def decrypt(self, data, key, key_idx=0):
+        header = bytes(data[:self.HEADER_SIZE])
+        cipher = AES.new(key, AES.MODE_CTR,
+                         nonce=self.nonce(key_idx, header))
+        return cipher.decrypt(data[self.HEADER_SIZE:])
+
+    def get_name(self):
+        return self.name
+
+
 class EncryptSchemes(Enum):
     ABSTRACT = AbstractEncryptionScheme
     AES = AESEncryption
+    AESCTR = AESCTREncryption
     DEBUG = DebugEncryption
     XOR = XOREncryption
 
@@ -164,24 +243,272 @@ class DebugKeyGenerator(AbstractKeyGenerator):
         return self.key
 
 
+def fill_random(buffer):
+    """
+    Fill a writable buffer with OS randomness in place where possible.
+    """
+    view = memoryview(buffer).cast('B')
+    try:
+        with open('/dev/urandom', 'rb', buffering=0) as urandom:
+            filled = 0
+            while filled < len(view):
+                filled += urandom.readinto(view[filled:])
+    except OSError:
+        view[:] = os.urandom(len(view))
+
+
+class RandomKeySource:
+    """
+    Bulk source of random key material.
+
+    Keys are cut as zero-copy slices from large batches filled straight
+    from the OS, instead of one `os.urandom` call (and string round-trip)
+    per key. With `prefetch`, a background thread keeps up to `prefetch`
+    batches filled ahead of the consumer.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        Size of each batch in bytes.
+    prefetch : int, optional
+        Number of batches to prepare in the background (0 to disable).
+    """
+
+    def __init__(self, batch_size=1 << 16, prefetch=0):
+        self.batch_size = batch_size
+        self.batch = memoryview(b'')
+        self.position = 0
+        self.lock = Lock()
+
+        self.batches = None
+        self.stopped = Event()
+        if prefetch:
+            self.batches = queue.Queue(maxsize=prefetch)
+            Thread(target=self._prefetch, daemon=True).start()
+
+    def _new_batch(self, size):
+        batch = bytearray(size)
+        fill_random(batch)
+        return memoryview(batch)
+
+    def _prefetch(self):
+        while not self.stopped.is_set():
+            batch = self._new_batch(self.batch_size)
+            while not self.stopped.is_set():
+                try:
+                    self.batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def _next_batch(self):
+        if self.batches is not None:
+            try:
+                return self.batches.get_nowait()
+            except queue.Empty:
+                pass
+        return self._new_batch(self.batch_size)
+
+    def take(self, length):
+        """
+        Return `length` fresh random bytes as a memoryview.
+        """
+        if length > self.batch_size:
+            return self._new_batch(length)
+        with self.lock:
+            if self.position + length > len(self.batch):
+                self.batch = self._next_batch()
+                self.position = 0
+            view = self.batch[self.position:self.position + length]
+            self.position += length
+            return view
+
+    def take_bits(self, n_bits):
+        """
+        Return `n_bits` fresh random bits as a bitarray, sharing memory
+        with the batch when `n_bits` is a whole number of bytes.
+        """
+        key = bitarray(buffer=self.take((n_bits + 7) // 8))
+        if n_bits % 8:
+            key = key[:n_bits]
+        return key
+
+    def stop(self):
+        self.stopped.set()
+
+
 class RandomKeyGenerator(AbstractKeyGenerator):
-    def __init__(self, key_length=0):
+    def __init__(self, key_length=0, source: RandomKeySource = None):
         self.key_length = key_length
         self.key: bitarray = None
+        self.source = source if source else RandomKeySource(batch_size=4096)
 
     def generate_key(self, key_length=0):
         if key_length:
             self.key_length = key_length
         elif self.key_length < 1:
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray([int(b) for b in format(int.from_bytes(os.urandom(
-            (self.key_length + 7) // 8), 'big'),
-            f'0{self.key_length}b')[:self.key_length]])
+        self.key = self.source.take_bits(self.key_length)
 
     def get_key(self):
         return self.key
 
 
+class KeyMaterialExhausted(ValueError):
+    """The key file has no unused material left."""
+
+
+def offset_file_name(file_name):
+    return file_name + ".offset"
+
+
+def persisted_offset(file_name=os.path.dirname(__file__) + "/key.bin"):
+    """
+    Return how many bytes of the key file earlier calls may have used, as
+    recorded by `KeystreamPool`.
+    """
+    try:
+        with open(offset_file_name(file_name)) as file:
+            return int(file.read())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+class KeystreamPool:
+    """
+    Zero-copy pool of key material backed by a memory-mapped key file.
+
+    `take()` hands out consecutive, never-reused slices of any length and
+    the offset they start at; a peer holding the same file recovers the
+    same slice with `slice(offset, length)`. `claim()` consumes material
+    at a given offset instead, for schedules both peers index directly.
+    Slices are memoryviews into the mapping, so handing out key material
+    costs no syscalls or copies.
+
+    Consumption survives restarts: the offset is persisted next to the
+    key file (see `persisted_offset`), rounded up by `reserve` bytes so it
+    is only rewritten every so often. Material skipped that way is never
+    used, which is safe; reusing material is not.
+
+    Parameters
+    ----------
+    file_name : str, optional
+        Key file to map (e.g. a QKD key dump).
+    low_water : int, optional
+        Remaining byte count at or below which low-water listeners fire.
+    reserve : int, optional
+        Bytes persisted ahead of the offset actually reached.
+    """
+
+    def __init__(self,
+                 file_name=os.path.dirname(__file__) + "/key.bin",
+                 low_water=1 << 20, reserve=1 << 10):
+        self.file_name = file_name
+        self.file = open(self.file_name, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if self.size else None
+        self.view = memoryview(self.mmap) if self.mmap else memoryview(b'')
+
+        self.offset = min(persisted_offset(file_name), self.size)
+        self.reserve = reserve
+        self.persisted = self.offset
+        self.low_water = low_water
+        self.listeners = []
+        self.alerted = False
+        self.lock = Lock()
+
+    @property
+    def consumed(self):
+        return self.offset
+
+    @property
+    def remaining(self):
+        return self.size - self.offset
+
+    def on_low_water(self, callback):
+        """
+        Register `callback(remaining)`, called once when the pool first
+        drops to `low_water` bytes or fewer.
+        """
+        self.listeners.append(callback)
+
+    def take(self, length):
+        """
+        Consume the next `length` bytes. Returns `(offset, memoryview)`.
+        """
+        with self.lock:
+            if length > self.remaining:
+                raise KeyMaterialExhausted(
+                    f"Error, key material exhausted ({self.remaining} bytes "
+                    f"left, {length} requested)")
+            offset = self.offset
+            alert = self._advance(offset + length)
+
+        if alert:
+            for callback in self.listeners:
+                callback(self.remaining)
+        return offset, self.view[offset:offset + length]
+
+    def claim(self, offset, length):
+        """
+        Consume the key material at `offset`, and with it everything
+        before it. Returns a memoryview; material already consumed may
+        be claimed again, e.g. by the receiving side of a schedule.
+        """
+        if offset < 0:
+            raise ValueError("Error, key slice out of range")
+        with self.lock:
+            if offset + length > self.size:
+                raise KeyMaterialExhausted(
+                    f"Error, key material exhausted ({self.size} bytes, "
+                    f"{offset + length} needed)")
+            alert = self._advance(offset + length)
+
+        if alert:
+            for callback in self.listeners:
+                callback(self.remaining)
+        return self.view[offset:offset + length]
+
+    def _advance(self, end):
+        """
+        Move the offset forward to `end`, persisting it if needed. Called
+        with the lock held; returns whether low-water listeners are due.
+        """
+        self.offset = max(self.offset, end)
+        if self.offset > self.persisted:
+            self.persisted = min(self.size, self.offset + self.reserve)
+            self._persist()
+        alert = not self.alerted and self.remaining <= self.low_water
+        if alert:
+            self.alerted = True
+        return alert
+
+    def _persist(self):
+        # Replaced atomically, so a crash never leaves a truncated offset
+        name = offset_file_name(self.file_name)
+        with open(name + ".tmp", "w") as file:
+            file.write(str(self.persisted))
+        os.replace(name + ".tmp", name)
+
+    def slice(self, offset, length):
+        """
+        Return the key material at `offset` without consuming it.
+        """
+        if offset < 0 or offset + length > self.size:
+            raise ValueError("Error, key slice out of range")
+        return self.view[offset:offset + length]
+
+    def close(self):
+        """
+        Unmap the key file. Slices handed out must have been released.
+        """
+        self.view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
+
 class FileKeyGenerator(AbstractKeyGenerator):
     # TODO: handle if we don't have a key file
     def __init__(self,
@@ -190,20 +517,124 @@ class FileKeyGenerator(AbstractKeyGenerator):
         self.key_length = key_length
         self.key: bitarray = None
         self.file_name = file_name
-        self.file = open(self.file_name, "rb")
+        self.pool = KeystreamPool(self.file_name)
 
     def generate_key(self, key_length=0):
         if key_length:
             self.key_length = key_length
         elif self.key_length < 1:
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray()
-        self.key.frombytes(self.file.read((key_length + 7) // 8))
+        _, key = self.pool.take((self.key_length + 7) // 8)
+        self.key = bitarray(buffer=key)
 
     def get_key(self):
         return self.key
 
 
+class KeyRing:
+    """
+    Fixed-size ring of recent keys indexed by key index.
+
+    Slot `key_idx % capacity` holds `(key_idx, key)`, so adding a key
+    evicts the one `capacity` indices older and lookups are O(1). Keeping
+    neighbouring keys lets packets encrypted just before or after a
+    rotation still be decrypted.
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+
+    def add(self, key_idx, key):
+        self.slots[key_idx % self.capacity] = (key_idx, key)
+
+    def get(self, key_idx):
+        """
+        Return the key for `key_idx`, or `None` if it is not in the ring.
+        """
+        entry = self.slots[key_idx % self.capacity]
+        if entry is None or entry[0] != key_idx:
+            return None
+        return entry[1]
+
+    def __contains__(self, key_idx):
+        return self.get(key_idx) is not None
+
+
+class KeySchedule:
+    """
+    Deterministic key schedule shared by both peers.
+
+    Key `i` is the slice of the shared key file at
+    `offset + i * key_bytes` and is in force from `epoch + i * period`.
+    Peers that agree on `epoch` and `offset` (both negotiated at
+    `/peer_connection`) therefore agree on every key, and the current
+    index is computed from the clock on demand rather than advanced by a
+    sleeping thread. Derived keys are cached in a `KeyRing`.
+
+    Every key used is claimed from the `KeystreamPool`, so the next call
+    starts past it (see `persisted_offset`) and no key is used twice.
+    `current()` raises `KeyMaterialExhausted` once the file runs out.
+
+    Parameters
+    ----------
+    epoch : float
+        Shared start time (seconds since the Unix epoch).
+    offset : int, optional
+        Byte offset of key 0 in the key file; the larger of both peers'
+        `persisted_offset()`.
+    period : float, optional
+        Seconds each key is in force.
+    key_length : int, optional
+        Key length in bits.
+    pool : KeystreamPool, optional
+    window : int, optional
+        How many keys before the current one are still accepted; one key
+        ahead is always accepted to absorb clock skew.
+    """
+
+    def __init__(self, epoch, offset=0, period=1.0, key_length=128,
+                 pool: KeystreamPool = None, window=2):
+        self.epoch = epoch
+        self.offset = offset
+        self.period = period
+        self.key_bytes = (key_length + 7) // 8
+        self.pool = pool if pool else KeystreamPool()
+        self.window = window
+        self.keys = KeyRing(capacity=window + 2)
+
+    def index_at(self, t):
+        return max(0, int((t - self.epoch) // self.period))
+
+    def derive(self, key_idx):
+        key = self.keys.get(key_idx)
+        if key is None:
+            key = bytes(self.pool.claim(
+                self.offset + key_idx * self.key_bytes, self.key_bytes))
+            self.keys.add(key_idx, key)
+        return key
+
+    def current(self):
+        """
+        Return `(key_idx, key)` for the key in force now.
+        """
+        key_idx = self.index_at(time.time())
+        return key_idx, self.derive(key_idx)
+
+    def get(self, key_idx):
+        """
+        Return the key for `key_idx` if it is within the accepted window
+        around the current index, else `None`.
+        """
+        cur_key_idx = self.index_at(time.time())
+        if not cur_key_idx - self.window <= key_idx <= cur_key_idx + 1:
+            return None
+        try:
+            return self.derive(key_idx)
+        except ValueError:
+            return None
+
+
 class KeyGenerators(Enum):
     ABSTRACT = AbstractKeyGenerator
     FILE = FileKeyGenerator
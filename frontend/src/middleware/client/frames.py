@@ -0,0 +1,273 @@
+import cv2
+import numpy as np
+import time
+
+from threading import Lock
+
+from custom_logging import logger
+
+# region --- Buffers ---
+
+
+class FramePool:
+    """
+    Fixed set of preallocated frame buffers.
+
+    `acquire()` hands out a free buffer, which stays reserved until it is
+    given back with `release()`, so a frame still queued or being encoded
+    is never overwritten. When every buffer is in use a fresh one is
+    allocated instead (counted in `exhausted`); releasing it is a no-op.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width, channels)
+    count : int, optional
+    """
+
+    def __init__(self, shape, count=4):
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(count)]
+        self.shape = shape
+        self.owned = {id(buffer) for buffer in self.buffers}
+        self.free = list(self.buffers)
+        self.lock = Lock()
+        self.exhausted = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.exhausted += 1
+        return np.empty(self.shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        if id(buffer) not in self.owned:
+            return
+        with self.lock:
+            if all(free is not buffer for free in self.free):
+                self.free.append(buffer)
+
+# endregion
+
+
+# region --- Sources ---
+
+
+def fourcc_name(code):
+    return ''.join(chr((int(code) >> 8 * i) & 0xFF) for i in range(4))
+
+
+class CameraSource:
+    """
+    Camera frames at `shape` without per-frame allocations.
+
+    On `open()` the camera is asked for `shape` in each of `FOURCCS` in
+    turn (compressed MJPEG first, as it reaches higher resolutions and
+    frame rates over USB than raw YUYV). The first exact match is used;
+    otherwise the smallest offered mode that still covers `shape`, so
+    only a downscale is needed.
+
+    Frames are read straight into pooled buffers when the camera delivers
+    `shape`; otherwise they are read into one reused capture buffer and
+    resized into a pooled buffer (`dst=`). Hand each returned frame back
+    with `release()` once it has been consumed.
+
+    Many cameras ignore `CAP_PROP_FPS`, so frames are also decimated to
+    `frame_rate`: frames arriving ahead of schedule are grabbed but never
+    decoded, and the rest are delivered as they come.
+
+    `reconfigure()` changes `shape` and `frame_rate` without reopening the
+    camera: it keeps its mode and frames are scaled and decimated to suit.
+
+    Parameters
+    ----------
+    device : int
+        OpenCV camera index.
+    shape : tuple
+        (height, width, channels) of the frames to produce (BGR).
+    frame_rate : int, optional
+        Requested capture rate, and the most frames `read()` returns per
+        second. `None` returns every frame the camera delivers.
+    pool_size : int, optional
+        See `FramePool`.
+    """
+    FOURCCS = ('MJPG', 'YUYV')
+    # Share of a frame period a frame may arrive early and still be used
+    EARLY = 0.25
+
+    def __init__(self, device, shape, frame_rate=None, pool_size=4):
+        self.device = device
+        self.shape = shape
+        self.size = (shape[1], shape[0])  # OpenCV wants (width, height)
+        self.frame_rate = frame_rate
+        self.pool = FramePool(shape, pool_size)
+        self.capture = None
+        self.mode = None  # (fourcc, width, height) in use
+        self.raw = None  # Reused capture buffer when resizing
+        self.next_frame = None
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.device)
+        self.mode = self.negotiate()
+        self.next_frame = time.monotonic()
+        if self.mode[1:] == self.size:
+            logger.info(f"Camera {self.device} capturing {self.mode} natively.")
+        else:
+            logger.info(f"Camera {self.device} capturing {self.mode}; "
+                        f"resizing to {self.size}.")
+        return self
+
+    def reconfigure(self, shape, frame_rate):
+        """
+        Produce frames at `shape` and `frame_rate` from now on. Frames
+        already handed out stay valid.
+        """
+        if shape != self.shape:
+            self.pool = FramePool(shape, len(self.pool.buffers))
+        self.shape = shape
+        self.size = (shape[1], shape[0])
+        self.frame_rate = frame_rate
+        self.raw = None  # Read natively again if the mode matches
+        self.next_frame = time.monotonic()
+
+    def request(self, fourcc, width, height):
+        """Ask for a mode and return the one the camera actually chose."""
+        self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if self.frame_rate is not None:
+            self.capture.set(cv2.CAP_PROP_FPS, self.frame_rate)
+        return (fourcc_name(self.capture.get(cv2.CAP_PROP_FOURCC)),
+                int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def negotiate(self):
+        modes = []
+        for fourcc in self.FOURCCS:
+            mode = self.request(fourcc, *self.size)
+            if mode[1:] == self.size:
+                return mode
+            modes.append(mode)
+
+        def area(mode):
+            return mode[1] * mode[2]
+
+        covering = [mode for mode in modes
+                    if mode[1] >= self.size[0] and mode[2] >= self.size[1]]
+        best = min(covering, key=area) if covering else max(modes, key=area)
+        if best != modes[-1]:
+            best = self.request(*best)
+        return best
+
+    def grab(self):
+        """
+        Grab camera frames until one is due at `frame_rate`.
+        Return `False` if the camera produced nothing.
+        """
+        while True:
+            if not self.capture.grab():
+                return False
+            if self.frame_rate is None:
+                return True
+            period = 1 / self.frame_rate
+            now = time.monotonic()
+            if now < self.next_frame - period * self.EARLY:
+                continue  # Early; skipped before it is decoded
+            # Keep to the schedule, unless the camera is falling behind it
+            self.next_frame = max(self.next_frame + period, now)
+            return True
+
+    def read(self):
+        """
+        Return the next frame, or `None` if the camera produced nothing.
+        """
+        if not self.grab():
+            return None
+        if self.raw is None:
+            frame = self.pool.acquire()
+            ok, image = self.capture.retrieve(image=frame)
+            if ok and np.may_share_memory(image, frame):
+                return frame  # Camera matches `shape`; no resize needed
+            self.pool.release(frame)
+            if not ok:
+                return None
+            # Camera's native size differs; keep its buffer from now on
+            self.raw = image
+        else:
+            ok, image = self.capture.retrieve(image=self.raw)
+            if not ok:
+                return None
+            self.raw = image  # Only reallocated if the camera mode changed
+
+        return cv2.resize(image, self.size, dst=self.pool.acquire())
+
+    def release(self, frame):
+        """Return a frame from `read()` to the pool."""
+        self.pool.release(frame)
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class SyntheticSource:
+    """
+    Test pattern with the same interface as `CameraSource`, for running
+    the video path without a camera. A bar sweeps across a fixed gradient
+    so that consecutive frames differ; frames are paced at `frame_rate`.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width, channels)
+    frame_rate : int, optional
+        `None` produces frames as fast as they are read.
+    pool_size : int, optional
+        See `FramePool`.
+    """
+    BAR_WIDTH = 16
+
+    def __init__(self, shape, frame_rate=None, pool_size=4):
+        self.pool = FramePool(shape, pool_size)
+        self.count = 0
+        self.reconfigure(shape, frame_rate)
+
+    def open(self):
+        self.next_frame = time.monotonic()
+        return self
+
+    def reconfigure(self, shape, frame_rate):
+        """See `CameraSource.reconfigure`."""
+        if shape != self.pool.shape:
+            self.pool = FramePool(shape, len(self.pool.buffers))
+        self.shape = shape
+        self.frame_rate = frame_rate
+        height, width, channels = shape
+        self.background = np.empty(shape, dtype=np.uint8)
+        self.background[:] = np.linspace(
+            0, 255, width, dtype=np.uint8)[np.newaxis, :, np.newaxis]
+        self.next_frame = time.monotonic()
+
+    def read(self):
+        if self.frame_rate is not None:
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame += 1 / self.frame_rate
+
+        frame = self.pool.acquire()
+        np.copyto(frame, self.background)
+        x = (self.count * self.BAR_WIDTH // 2) % self.shape[1]
+        frame[:, x:x + self.BAR_WIDTH] = 255
+        self.count += 1
+        return frame
+
+    def release(self, frame):
+        """Return a frame from `read()` to the pool."""
+        self.pool.release(frame)
+
+    def close(self):
+        pass
+
+# endregion
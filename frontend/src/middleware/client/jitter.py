@@ -0,0 +1,201 @@
+import math
+import numpy as np
+
+from threading import Lock
+
+from client.protocol import now_ms
+
+
+class JitterBuffer:
+    """
+    Reorders received audio frames and releases them at a steady pace.
+
+    Frames are kept encoded, keyed on their packet sequence number, and
+    are only decoded at playout, so the decoder sees them in sequence
+    order and knows exactly which ones are missing. Playout starts once
+    `target` frames are buffered. The target follows the measured
+    interarrival jitter (RFC 3550 estimator) between `min_depth` and
+    `max_depth`, so the buffer is only as deep as the network needs.
+
+    When the frame due for playout is missing, the codec's own packet
+    loss concealment fills in (see `AbstractAudioCodec.conceal`), or for
+    codecs without one the last frame is repeated at decaying gain; after
+    `MAX_CONCEALED` consecutive losses silence is played instead. If the
+    buffer runs dry it re-primes, and when it grows past the target (e.g.
+    after a burst) the oldest frames are skipped to win the latency back.
+
+    A frame from a different stream, or one more than `RESTART_GAP`
+    frames behind the playout position, means the sender started over
+    (e.g. reconnected with a fresh sequence), so the buffer is reset
+    rather than treating everything as late.
+
+    Parameters
+    ----------
+    frame_bytes : int
+        Size of one frame of int16 PCM.
+    frame_ms : float
+        Duration of one frame.
+    min_depth : int, optional
+    max_depth : int, optional
+        Bounds on the target depth, in frames.
+    """
+    JITTER_GAIN = 1 / 16  # RFC 3550 estimator gain
+    JITTER_FACTOR = 2  # Buffered time per unit of measured jitter
+    MAX_CONCEALED = 3
+    CONCEAL_DECAY = 0.5
+    RESTART_GAP = 50  # frames
+
+    def __init__(self, frame_bytes, frame_ms, min_depth=1, max_depth=8):
+        self.frame_ms = frame_ms
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.lock = Lock()
+
+        self.frames = {}  # seq -> (codec, payload)
+        self.codec = None  # Codec of the last frame played
+        self.stream_id = None
+        self.next_seq = None
+        self.playing = False
+        self.last_transit = None
+        self.jitter = 0.0  # ms
+        self.target = min_depth
+
+        self.silence = bytes(frame_bytes)
+        self.last = np.zeros(frame_bytes // 2, dtype=np.int16)
+        self.concealment = np.zeros_like(self.last)
+        self.concealed_run = 0
+
+        self.received = 0
+        self.played = 0
+        self.late = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.concealed = 0
+        self.underruns = 0
+        self.skipped = 0
+        self.restarts = 0
+
+    # region --- Input ---
+
+    def push(self, seq, timestamp, payload, codec, stream_id=None):
+        """
+        Add a frame sent at `timestamp` (sender clock, ms) on `stream_id`,
+        encoded with `codec`.
+        """
+        arrival = now_ms()
+        with self.lock:
+            self.received += 1
+            if self._restarted(seq, stream_id):
+                self._reset(stream_id)
+            self._update_jitter(arrival, timestamp)
+            if self.next_seq is not None and seq < self.next_seq:
+                self.late += 1
+                return
+            if seq in self.frames:
+                self.duplicates += 1
+                return
+            self.frames[seq] = (codec, payload)
+
+    def _restarted(self, seq, stream_id):
+        if stream_id != self.stream_id:
+            return True
+        return (self.next_seq is not None
+                and seq + self.RESTART_GAP < self.next_seq)
+
+    def _reset(self, stream_id):
+        if self.stream_id is not None or self.next_seq is not None:
+            self.restarts += 1
+        self.stream_id = stream_id
+        self.frames.clear()
+        self.next_seq = None
+        self.playing = False
+        self.last_transit = None
+
+    def _update_jitter(self, arrival, timestamp):
+        transit = (arrival - timestamp) & 0xFFFFFFFF
+        if self.last_transit is not None:
+            # Signed difference of wrapping uint32 millisecond clocks
+            d = ((transit - self.last_transit + (1 << 31))
+                 & 0xFFFFFFFF) - (1 << 31)
+            self.jitter += (abs(d) - self.jitter) * self.JITTER_GAIN
+        self.last_transit = transit
+
+        depth = 1 + math.ceil(
+            self.JITTER_FACTOR * self.jitter / self.frame_ms)
+        self.target = max(self.min_depth, min(self.max_depth, depth))
+
+    # endregion
+
+    # region --- Output ---
+
+    def pop(self):
+        """
+        Return the next frame to play. Never blocks: plays concealment or
+        silence when there is nothing to play.
+        """
+        with self.lock:
+            if not self.playing:
+                if len(self.frames) < self.target:
+                    return self.silence
+                self.playing = True
+                if self.next_seq is None or min(self.frames) > self.next_seq:
+                    self.next_seq = min(self.frames)
+
+            if not self.frames:
+                # Nothing left; the due frame may still arrive, so re-prime
+                self.playing = False
+                self.underruns += 1
+                return self._conceal()
+
+            # Skip ahead when a burst left us deeper than needed
+            while len(self.frames) > self.target + 1:
+                oldest = min(self.frames)
+                del self.frames[oldest]
+                self.next_seq = oldest + 1
+                self.skipped += 1
+
+            seq, self.next_seq = self.next_seq, self.next_seq + 1
+            frame = self.frames.pop(seq, None)
+            if frame is None:
+                self.lost += 1
+                return self._conceal()
+
+            self.codec, payload = frame
+            frame = self.codec.decode(payload)
+            self.played += 1
+            self.concealed_run = 0
+            if len(frame) == len(self.silence):
+                self.last[:] = np.frombuffer(frame, dtype=np.int16)
+            return frame
+
+    def _conceal(self):
+        self.concealed += 1
+        self.concealed_run += 1
+        if self.concealed_run > self.MAX_CONCEALED:
+            return self.silence
+        if self.codec is not None:
+            frame = self.codec.conceal()
+            if frame is not None and len(frame) == len(self.silence):
+                return frame
+        gain = self.CONCEAL_DECAY ** self.concealed_run
+        np.multiply(self.last, gain, out=self.concealment, casting='unsafe')
+        return self.concealment.tobytes()
+
+    # endregion
+
+    def stats(self):
+        with self.lock:
+            return {
+                'depth': len(self.frames),
+                'target': self.target,
+                'jitter_ms': round(self.jitter, 1),
+                'received': self.received,
+                'played': self.played,
+                'late': self.late,
+                'duplicates': self.duplicates,
+                'lost': self.lost,
+                'concealed': self.concealed,
+                'underruns': self.underruns,
+                'skipped': self.skipped,
+                'restarts': self.restarts,
+            }
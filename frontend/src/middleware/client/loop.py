@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from custom_logging import logger
+
+
+class MessageLoop(Thread):
+    """
+    Single long-lived asyncio loop that handles incoming messages.
+
+    Socket.IO delivers messages on its own threads; `submit()` hands them
+    to this loop through a thread-safe queue instead of creating and
+    tearing down an event loop per packet. Receive latency (time from
+    `submit()` to the handler finishing) is tracked for `stats()`.
+
+    Handlers must not block the loop: blocking work (e.g. writing to a
+    decoder's pipe) is awaited through `run_blocking()`, which runs it on
+    a worker thread while other handlers, such as audio, keep going.
+    Blocking work queues up per lane; handlers should shed their own
+    work while `lane_full()` rather than add to it.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of messages queued or being handled; further
+        messages are dropped until the loop catches up.
+    lane_size : int, optional
+        Number of `run_blocking()` calls queued or running in a lane at
+        which `lane_full()` reports it as full.
+    """
+
+    def __init__(self, maxsize=256, lane_size=8):
+        super().__init__(name='MessageLoop', daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self.maxsize = maxsize
+        self.lane_size = lane_size
+        self.queue = asyncio.Queue()
+        self.tasks = set()
+        self.executors = {}  # lane -> single-threaded executor
+        self.lanes = {}  # lane -> calls queued or running
+
+        self.handled = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.consume())
+        self.loop.close()
+
+    async def consume(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            # Handlers start in arrival order; one waiting on blocking work
+            # doesn't hold up the next
+            task = self.loop.create_task(self.handle(*item))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+    async def handle(self, handler, args, submitted):
+        try:
+            await handler(*args)
+        except Exception as e:
+            logger.error(f"Message handler {handler.__name__} failed: {e}")
+
+        latency = time.perf_counter() - submitted
+        self.handled += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def run_blocking(self, lane, func, *args):
+        """
+        Return an awaitable running `func(*args)` off the loop, on a thread
+        of its own for `lane`. Calls in the same lane run one at a time in
+        the order they were made, e.g. to keep a stream's data in order.
+        Must be called from the loop.
+        """
+        if lane not in self.executors:
+            self.executors[lane] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"MessageLoop{lane}")
+        self.lanes[lane] = self.lanes.get(lane, 0) + 1
+        future = self.loop.run_in_executor(self.executors[lane], func, *args)
+        future.add_done_callback(lambda _: self._lane_done(lane))
+        return future
+
+    def _lane_done(self, lane):
+        self.lanes[lane] -= 1
+
+    def lane_full(self, lane):
+        """`True` while `lane_size` calls are queued or running in `lane`."""
+        return self.lanes.get(lane, 0) >= self.lane_size
+
+    def _put(self, item):
+        if self.queue.qsize() + len(self.tasks) >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(item)
+
+    def submit(self, handler, *args):
+        """
+        Schedule `await handler(*args)` on the loop. Safe to call from
+        any thread.
+        """
+        if not self.loop.is_running():
+            self.dropped += 1
+            return
+        self.loop.call_soon_threadsafe(
+            self._put, (handler, args, time.perf_counter()))
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+        self.join()
+
+    def stats(self):
+        return {
+            'handled': self.handled,
+            'dropped': self.dropped,
+            'pending': self.queue.qsize() + len(self.tasks),
+            'lanes': dict(self.lanes),
+            'latency_mean': self.latency_total / self.handled
+            if self.handled else 0.0,
+            'latency_max': self.latency_max,
+        }
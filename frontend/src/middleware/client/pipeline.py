@@ -0,0 +1,203 @@
+import queue
+
+from abc import ABC, abstractmethod
+from threading import Event, Thread
+
+from client.scheduler import apply_priority
+from custom_logging import logger
+
+# region --- Queues ---
+
+
+class DropOldestQueue(queue.Queue):
+    """
+    Bounded queue whose `put` never blocks: when full, the oldest item is
+    discarded to make room. Keeps a slow consumer from accumulating lag.
+    Discarded items are passed to `on_drop`, if given.
+    """
+
+    def __init__(self, maxsize=2, on_drop=None):
+        super().__init__(maxsize)
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item, block=False, timeout=None):
+        discarded = []
+        with self.not_full:
+            while 0 < self.maxsize <= self._qsize():
+                discarded.append(self._get())
+                self.dropped += 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        if self.on_drop is not None:
+            for old in discarded:
+                self.on_drop(old)
+
+# endregion
+
+
+# region --- Workers ---
+
+
+class Worker(Thread, ABC):
+    """
+    Base pipeline worker. Runs `step` until stopped.
+
+    An item whose `step` raises is logged and skipped: a dead worker
+    would leave the stages around it blocked for good.
+
+    NOTE: `step` must return periodically (e.g. use timeouts) so the
+    worker can observe `stop()`.
+    """
+    POLL = 0.1
+
+    def __init__(self, name, outbox=None, priority=None):
+        super().__init__(name=name, daemon=True)
+        self.outbox = outbox
+        self.priority = priority
+        self.stopped = Event()
+        self.processed = 0
+        self.errors = 0
+
+    def run(self):
+        apply_priority(self.priority)
+        while not self.stopped.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Pipeline worker {self.name} failed: {e}")
+
+    @abstractmethod
+    def step(self):
+        pass
+
+    def emit(self, item):
+        self.processed += 1
+        if item is None or self.outbox is None:
+            return
+        # Waits for room in lossless queues, but not past `stop()`. Tried
+        # at least once, so an item produced while stopping is still
+        # queued where its owner can find it.
+        while True:
+            try:
+                self.outbox.put(item, timeout=self.POLL)
+                return
+            except queue.Full:
+                if self.stopped.is_set():
+                    return
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Source(Worker):
+    """
+    Produces items by calling `produce()`; `None` results and
+    `queue.Empty` are ignored.
+    """
+
+    def __init__(self, name, produce, outbox=None, priority=None):
+        super().__init__(name, outbox, priority)
+        self.produce = produce
+
+    def step(self):
+        try:
+            item = self.produce()
+        except queue.Empty:
+            return
+        self.emit(item)
+
+
+class Stage(Worker):
+    """
+    Applies `func` to each item from `inbox`, forwarding non-`None`
+    results to `outbox`.
+    """
+
+    def __init__(self, name, func, inbox, outbox=None, priority=None):
+        super().__init__(name, outbox, priority)
+        self.func = func
+        self.inbox = inbox
+
+    def step(self):
+        try:
+            item = self.inbox.get(timeout=self.POLL)
+        except queue.Empty:
+            return
+        self.emit(self.func(item))
+
+# endregion
+
+
+# region --- Pipeline ---
+
+
+class Pipeline:
+    """
+    A set of workers connected by bounded queues.
+
+    Each stage runs on its own thread, so e.g. capture, encode, encrypt
+    and transmit overlap instead of running serially. Queues drop their
+    oldest item when full, so a stalled stage sheds stale items rather
+    than building up latency, unless created `lossless`: those block the
+    producer instead, for items that cannot be skipped (e.g. encoded
+    P-frames, which later frames are predicted from).
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Capacity of each queue created with `queue()`.
+    priority : Priority, optional
+        Scheduling priority applied to every worker thread.
+    """
+
+    def __init__(self, maxsize=2, priority=None):
+        self.maxsize = maxsize
+        self.priority = priority
+        self.queues = {}
+        self.workers = []
+
+    def queue(self, name, lossless=False, on_drop=None):
+        """
+        Create a queue between stages. `on_drop` is called with each item
+        a drop-oldest queue discards, e.g. to recycle its buffer.
+        """
+        if lossless:
+            self.queues[name] = queue.Queue(self.maxsize)
+        else:
+            self.queues[name] = DropOldestQueue(self.maxsize, on_drop)
+        return self.queues[name]
+
+    def source(self, name, produce, outbox=None):
+        self.workers.append(Source(name, produce, outbox, self.priority))
+
+    def stage(self, name, func, inbox, outbox=None):
+        self.workers.append(
+            Stage(name, func, inbox, outbox, self.priority))
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.join()
+
+    def stats(self):
+        """
+        Return per-queue depth, capacity and drop counts.
+        """
+        return {name: {'depth': q.qsize(), 'maxsize': q.maxsize,
+                       'dropped': getattr(q, 'dropped', 0)}
+                for name, q in self.queues.items()}
+
+    def errors(self):
+        """Return the number of items each worker failed on."""
+        return {worker.name: worker.errors for worker in self.workers}
+
+# endregion
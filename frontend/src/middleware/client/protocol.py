@@ -0,0 +1,82 @@
+import struct
+import time
+import zlib
+
+from enum import IntFlag
+from typing import NamedTuple
+
+# region --- Header ---
+
+# Media packets are a fixed binary header followed by the (encrypted)
+# payload, sent as a single Socket.IO binary attachment.
+#
+#   stream_id : uint32  identifies the sending user and media stream
+#   seq       : uint32  per-stream packet sequence number
+#   timestamp : uint32  sender clock in milliseconds (wraps)
+#   key_idx   : uint32  index of the key the payload is encrypted with
+#   flags     : uint8   see `Flags`
+HEADER = struct.Struct('!IIIIB')
+
+
+class Flags(IntFlag):
+    NONE = 0
+    KEYFRAME = 1  # Payload starts an independently decodable unit
+    OPUS = 2  # Audio payload is Opus rather than raw PCM
+    FEEDBACK = 4  # Signed receiver report; see `client.adaptation`
+
+
+class Packet(NamedTuple):
+    stream_id: int
+    seq: int
+    timestamp: int
+    key_idx: int
+    flags: Flags
+    payload: memoryview
+
+
+def get_stream_id(user_id, namespace):
+    return zlib.crc32(f"{user_id}{namespace}".encode())
+
+
+def now_ms():
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+
+def pack(stream_id, seq, timestamp, key_idx, flags, payload):
+    return HEADER.pack(stream_id, seq & 0xFFFFFFFF, timestamp & 0xFFFFFFFF,
+                       key_idx, flags) + payload
+
+
+def unpack(data):
+    """
+    Parse a media packet. The payload is a view into `data`.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"Packet too short ({len(data)} bytes)")
+    stream_id, seq, timestamp, key_idx, flags = HEADER.unpack_from(data)
+    return Packet(stream_id, seq, timestamp, key_idx, Flags(flags),
+                  memoryview(data)[HEADER.size:])
+
+# endregion
+
+
+# region --- Streams ---
+
+
+class PacketWriter:
+    """
+    Frames payloads for one outgoing stream, numbering them in order.
+    """
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.seq = 0
+
+    def pack(self, payload, key_idx, flags=Flags.NONE, timestamp=None):
+        packet = pack(self.stream_id, self.seq,
+                      now_ms() if timestamp is None else timestamp,
+                      key_idx, flags, payload)
+        self.seq += 1
+        return packet
+
+# endregion
@@ -0,0 +1,157 @@
+import os
+import threading
+
+from enum import IntEnum
+from threading import Event, Thread, Timer
+
+from custom_logging import logger
+
+# region --- Utils ---
+
+
+class Priority(IntEnum):
+    """Lower values are scheduled more favourably and stopped last."""
+    AUDIO = 0
+    VIDEO = 1
+
+
+# Niceness of a thread per priority level above the main thread's (best
+# effort; raising niceness never needs privileges, lowering it would).
+NICE_STEP = 5
+
+
+def apply_priority(priority: Priority):
+    """
+    Best-effort OS scheduling priority for the calling thread.
+    Only supported on Linux, where threads can be reniced individually.
+
+    Niceness is set absolutely, relative to the main thread (whose thread
+    id is the process id), because new threads inherit the niceness of
+    the thread that started them: a relative step would stack up for
+    e.g. pipeline workers started from a video task.
+    """
+    if priority is None or not hasattr(os, 'setpriority'):
+        return
+    try:
+        base = os.getpriority(os.PRIO_PROCESS, os.getpid())
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(),
+                       base + int(priority) * NICE_STEP)
+    except OSError:
+        pass
+
+# endregion
+
+
+# region --- Tasks ---
+
+
+class MediaTask(Thread):
+    """
+    Repeatedly calls `step()` until stopped.
+
+    Parameters
+    ----------
+    name : str
+    step : func, optional
+        One iteration of the task. If `None`, the task just holds whatever
+        `setup` started until it is stopped.
+    priority : Priority, optional
+    setup : func, optional
+        Called on the task's thread before the first step.
+    teardown : func, optional
+        Called on the task's thread once stopped, even after an error.
+    """
+
+    def __init__(self, name, step=None, priority=Priority.VIDEO,
+                 setup=None, teardown=None):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.priority = priority
+        self.setup = setup
+        self.teardown = teardown
+        self.stopped = Event()
+
+    def run(self):
+        apply_priority(self.priority)
+        try:
+            if self.setup is not None:
+                self.setup()
+            while not self.stopped.is_set():
+                if self.step is None:
+                    self.stopped.wait()
+                else:
+                    self.step()
+        except Exception as e:
+            logger.error(f"Media task {self.name} failed: {e}")
+        finally:
+            if self.teardown is not None:
+                self.teardown()
+
+    def sleep(self, seconds):
+        """
+        Sleep that returns early (with `True`) once the task is stopped.
+        """
+        return self.stopped.wait(seconds)
+
+    def stop(self):
+        self.stopped.set()
+
+# endregion
+
+
+# region --- Scheduler ---
+
+
+class MediaScheduler:
+    """
+    Owns every capture and playback task for a call.
+
+    Tasks can be delayed, stopped (signal and join) or cancelled (signal only), and
+    are all shut down together on disconnect. Adding a task under a name
+    that is already in use stops the previous one, so reconnects don't
+    leak threads.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.timers = {}
+
+    def add(self, name, task: MediaTask):
+        self.stop(name)
+        self.tasks[name] = task
+        return task
+
+    def start(self, name, delay=0):
+        task = self.tasks[name]
+        if delay:
+            self.timers[name] = Timer(delay, task.start)
+            self.timers[name].daemon = True
+            self.timers[name].start()
+        else:
+            task.start()
+
+    def cancel(self, name):
+        """Signal a task to stop without waiting for it."""
+        timer = self.timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        task = self.tasks.get(name)
+        if task is not None:
+            task.stop()
+        return task
+
+    def stop(self, name, timeout=None):
+        """Stop a task and wait for it to finish."""
+        task = self.cancel(name)
+        if task is None:
+            return
+        if task.is_alive() and task is not threading.current_thread():
+            task.join(timeout)
+        del self.tasks[name]
+
+    def stop_all(self, timeout=None):
+        # Stop lowest priority first so audio is the last to go
+        for name in sorted(self.tasks, key=lambda n: -self.tasks[n].priority):
+            self.stop(name, timeout)
+
+# endregion
@@ -0,0 +1,408 @@
+import socket
+import struct
+import time
+
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+from threading import Event, Lock, Thread
+
+from client.endpoint import Endpoint
+from custom_logging import logger
+
+# region --- Direct ---
+
+
+class DirectTransport(ABC):
+    """
+    Peer-to-peer media link.
+
+    One peer `listen()`s and advertises its endpoint through the
+    /peer_connection exchange; the other `connect()`s to it. Media packets
+    (see `client.protocol`) are then exchanged directly, so the server only
+    carries signalling. Until the link is up, or once it drops, `send()`
+    returns `False` and the caller falls back to the relay.
+
+    Parameters
+    ----------
+    channels : list of str
+        Namespaces carried by the link. Both peers must agree on the list;
+        each frame is tagged with the index of its namespace.
+    on_packet : func, optional
+        Called as `on_packet(namespace, packet)` on the reader thread.
+    """
+    CONNECT_TIMEOUT = 2  # seconds
+
+    def __init__(self, channels, on_packet=None):
+        self.channels = list(channels)
+        self.on_packet = on_packet
+        self.sock = None
+        self.connected = Event()
+
+        self.sent = 0
+        self.received = 0
+
+    @abstractmethod
+    def listen(self, ip, port=0):
+        """
+        Wait for the peer in the background.
+        Return the `Endpoint` actually bound (`port=0` picks a free port).
+        """
+        pass
+
+    @abstractmethod
+    def connect(self, endpoint):
+        """
+        Connect to a peer's advertised endpoint.
+        Raises `OSError` if the peer cannot be reached.
+        """
+        pass
+
+    @abstractmethod
+    def send(self, namespace, packet):
+        """
+        Send `packet` on the direct link.
+        Return `False` if it is not available.
+        """
+        pass
+
+    def deliver(self, channel, packet):
+        self.received += 1
+        if self.on_packet is not None:
+            self.on_packet(self.channels[channel], packet)
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'connected': self.connected.is_set(),
+                'sent': self.sent, 'received': self.received}
+
+# endregion
+
+
+# region --- TCP ---
+
+
+class TCPTransport(DirectTransport):
+    """
+    Direct link over a single TCP connection. Reliable and ordered, so a
+    lost segment delays everything behind it.
+    """
+    # Frame header: payload length, channel index
+    FRAME = struct.Struct('!IB')
+
+    def __init__(self, channels, on_packet=None):
+        super().__init__(channels, on_packet)
+        self.server = None
+        self.send_lock = Lock()
+
+    # region --- Setup ---
+
+    def listen(self, ip, port=0):
+        self.server = socket.create_server((ip, port))
+        Thread(target=self._accept, name='DirectAccept', daemon=True).start()
+        return Endpoint(ip, self.server.getsockname()[1])
+
+    def connect(self, endpoint):
+        sock = socket.create_connection(
+            tuple(endpoint), timeout=self.CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        self._attach(sock)
+
+    def _accept(self):
+        try:
+            sock, addr = self.server.accept()
+        except OSError:
+            return  # Closed before the peer connected
+        finally:
+            self.server.close()
+        logger.info(f"Direct media link accepted from {addr}.")
+        self._attach(sock)
+
+    def _attach(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.connected.set()
+        Thread(target=self._read, name='DirectRead', daemon=True).start()
+
+    def _detach(self):
+        if self.connected.is_set():
+            self.connected.clear()
+            logger.info("Direct media link closed; falling back to relay.")
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    # endregion
+
+    # region --- IO ---
+
+    def send(self, namespace, packet):
+        if not self.connected.is_set():
+            return False
+        header = self.FRAME.pack(len(packet), self.channels.index(namespace))
+        try:
+            with self.send_lock:
+                self.sock.sendall(header + packet)
+        except OSError:
+            self._detach()
+            return False
+        self.sent += 1
+        return True
+
+    def _recv_into(self, view):
+        while len(view):
+            n = self.sock.recv_into(view)
+            if n == 0:
+                raise ConnectionResetError("Peer closed direct media link")
+            view = view[n:]
+
+    def _read(self):
+        header = bytearray(self.FRAME.size)
+        try:
+            while True:
+                self._recv_into(memoryview(header))
+                length, channel = self.FRAME.unpack(header)
+                packet = bytearray(length)
+                self._recv_into(memoryview(packet))
+                self.deliver(channel, packet)
+        except (OSError, IndexError):
+            pass
+        finally:
+            self._detach()
+
+    # endregion
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._detach()
+
+# endregion
+
+
+# region --- UDP ---
+
+
+class UDPTransport(DirectTransport):
+    """
+    Direct link over UDP datagrams. Loss only costs the packets it hits
+    instead of stalling the ones behind them.
+
+    Packets larger than `MAX_PAYLOAD` are split into fragments and
+    reassembled by the receiver. Every packet carries a per-channel
+    sequence number. Each channel is delivered strictly in order:
+    duplicates are suppressed, packets older than the newest one already
+    delivered are discarded as late, and partially received packets are
+    abandoned once a newer packet completes.
+
+    UDP has no connection to lose, so both peers send a keepalive every
+    `KEEPALIVE_INTERVAL`; after `PEER_TIMEOUT` without hearing anything
+    from the peer the link counts as down (and `send()` falls back to the
+    relay) until the peer is heard from again.
+    """
+    # Datagram header: channel index, packet seq, fragment idx, fragment count
+    FRAME = struct.Struct('!BIHH')
+    MAX_PAYLOAD = 1200  # Keeps datagrams under common path MTUs
+    MAX_DATAGRAM = 65535
+    RECV_BUFFER = 1 << 20
+    # Recently delivered sequence numbers remembered per channel, to tell
+    # duplicates from late packets
+    HISTORY = 64
+    # Control datagrams use channels the media never does
+    HELLO, WELCOME, KEEPALIVE = 0xFF, 0xFE, 0xFD
+    HELLO_RETRIES = 10
+    KEEPALIVE_INTERVAL = 0.5  # seconds
+    PEER_TIMEOUT = 3  # seconds
+
+    def __init__(self, channels, on_packet=None):
+        super().__init__(channels, on_packet)
+        self.peer = None
+        self.closed = Event()
+        self.send_lock = Lock()
+        self.last_heard = None  # time.monotonic() of the last datagram
+
+        n = len(self.channels)
+        self.next_seq = [0] * n
+        self.delivered = [-1] * n
+        self.history = [deque(maxlen=self.HISTORY) for _ in range(n)]
+        self.partial = [{} for _ in range(n)]
+
+        self.duplicates = 0
+        self.late = 0
+        self.incomplete = 0
+
+    # region --- Setup ---
+
+    def _bind(self, ip, port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECV_BUFFER)
+        self.sock.bind((ip, port))
+        return self.sock.getsockname()
+
+    def _start(self):
+        Thread(target=self._read, name='DirectRead', daemon=True).start()
+        Thread(target=self._keepalive, name='DirectKeepalive',
+               daemon=True).start()
+
+    def listen(self, ip, port=0):
+        _, port = self._bind(ip, port)
+        self._start()
+        return Endpoint(ip, port)
+
+    def connect(self, endpoint):
+        """
+        Introduce ourselves to the listening peer, retrying until it answers.
+        Raises `TimeoutError` if it never does.
+        """
+        self.peer = tuple(endpoint)
+        self._bind('', 0)
+        self._start()
+
+        hello = self.FRAME.pack(self.HELLO, 0, 0, 0)
+        interval = self.CONNECT_TIMEOUT / self.HELLO_RETRIES
+        for _ in range(self.HELLO_RETRIES):
+            self.sock.sendto(hello, self.peer)
+            if self.connected.wait(interval):
+                return
+        self.close()
+        raise TimeoutError(f"No answer from {endpoint}")
+
+    def _control(self, channel, addr):
+        if channel == self.HELLO and (self.peer is None or addr == self.peer):
+            if self.peer is None:
+                logger.info(f"Direct media link accepted from {addr}.")
+            self.peer = addr
+            self.sock.sendto(self.FRAME.pack(self.WELCOME, 0, 0, 0), addr)
+            self._heard()
+        elif channel in (self.WELCOME, self.KEEPALIVE) and addr == self.peer:
+            self._heard()
+
+    def _heard(self):
+        self.last_heard = time.monotonic()
+        if not self.connected.is_set():
+            self.connected.set()
+            logger.info("Direct media link up.")
+
+    def _keepalive(self):
+        keepalive = self.FRAME.pack(self.KEEPALIVE, 0, 0, 0)
+        while not self.closed.wait(self.KEEPALIVE_INTERVAL):
+            if self.last_heard is None:
+                continue  # Not introduced yet
+            if (self.connected.is_set() and time.monotonic()
+                    - self.last_heard > self.PEER_TIMEOUT):
+                self.connected.clear()
+                logger.info("Direct media peer timed out; "
+                            "falling back to relay.")
+            try:
+                self.sock.sendto(keepalive, self.peer)
+            except OSError:
+                pass
+
+    # endregion
+
+    # region --- IO ---
+
+    def send(self, namespace, packet):
+        if not self.connected.is_set():
+            return False
+        channel = self.channels.index(namespace)
+        view = memoryview(packet)
+        count = max(1, -(-len(view) // self.MAX_PAYLOAD))
+        try:
+            with self.send_lock:
+                seq = self.next_seq[channel]
+                self.next_seq[channel] = (seq + 1) & 0xFFFFFFFF
+                for idx in range(count):
+                    chunk = view[idx * self.MAX_PAYLOAD:
+                                 (idx + 1) * self.MAX_PAYLOAD]
+                    self.sock.sendto(
+                        self.FRAME.pack(channel, seq, idx, count) + chunk,
+                        self.peer)
+        except OSError:
+            # Datagrams are fire-and-forget; a failed send is just a loss
+            return False
+        self.sent += 1
+        return True
+
+    def _read(self):
+        buffer = bytearray(self.MAX_DATAGRAM)
+        view = memoryview(buffer)
+        while not self.closed.is_set():
+            try:
+                n, addr = self.sock.recvfrom_into(buffer)
+            except OSError:
+                if self.closed.is_set():
+                    return
+                continue  # e.g. ICMP port unreachable while peer restarts
+            if n < self.FRAME.size:
+                continue
+            channel, seq, idx, count = self.FRAME.unpack_from(buffer)
+            if channel >= len(self.channels):
+                self._control(channel, addr)
+            elif addr == self.peer and idx < count:
+                self._heard()
+                self._receive(channel, seq, idx, count,
+                              view[self.FRAME.size:n])
+
+    def _receive(self, channel, seq, idx, count, chunk):
+        if seq <= self.delivered[channel]:
+            if seq in self.history[channel]:
+                self.duplicates += 1
+            else:
+                self.late += 1
+            return
+
+        if count == 1:
+            self._deliver(channel, seq, bytearray(chunk))
+            return
+
+        partial = self.partial[channel]
+        parts = partial.setdefault(seq, [None] * count)
+        if len(parts) != count or parts[idx] is not None:
+            self.duplicates += 1
+            return
+        parts[idx] = bytes(chunk)
+        if all(part is not None for part in parts):
+            del partial[seq]
+            self._deliver(channel, seq, bytearray(b''.join(parts)))
+
+    def _deliver(self, channel, seq, packet):
+        self.delivered[channel] = seq
+        self.history[channel].append(seq)
+
+        # Anything older can no longer be delivered in order
+        partial = self.partial[channel]
+        for stale in [s for s in partial if s < seq]:
+            del partial[stale]
+            self.incomplete += 1
+
+        self.deliver(channel, packet)
+
+    # endregion
+
+    def close(self):
+        self.closed.set()
+        self.connected.clear()
+        if self.sock is not None:
+            self.sock.close()
+
+    def stats(self):
+        return {**super().stats(), 'duplicates': self.duplicates,
+                'late': self.late, 'incomplete': self.incomplete}
+
+# endregion
+
+
+class MediaTransports(Enum):
+    TCP = TCPTransport
+    UDP = UDPTransport
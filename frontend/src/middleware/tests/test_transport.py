@@ -0,0 +1,111 @@
+"""
+Loopback tests for the direct media transports.
+
+Run from `src/middleware` with `python -m unittest discover -s tests -t .`.
+"""
+import time
+import unittest
+
+from client.transport import TCPTransport, UDPTransport
+
+CHANNELS = ['/audio', '/video']
+TIMEOUT = 2  # seconds
+
+
+def wait_for(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class LoopbackTest:
+    """Transport-independent checks; mixed into a `TestCase` below."""
+    transport = None
+
+    def setUp(self):
+        self.received = {'listener': [], 'dialer': []}
+        self.listener = self.transport(
+            CHANNELS, lambda ns, p: self.received['listener'].append(
+                (ns, bytes(p))))
+        self.dialer = self.transport(
+            CHANNELS, lambda ns, p: self.received['dialer'].append(
+                (ns, bytes(p))))
+        endpoint = self.listener.listen('127.0.0.1')
+        self.dialer.connect(endpoint)
+        self.assertTrue(self.listener.connected.wait(TIMEOUT))
+
+    def tearDown(self):
+        self.dialer.close()
+        self.listener.close()
+
+    def test_both_directions(self):
+        self.assertTrue(self.dialer.send('/audio', b'ping'))
+        self.assertTrue(self.listener.send('/video', b'pong'))
+        self.assertTrue(wait_for(lambda: self.received['listener']
+                                 and self.received['dialer']))
+        self.assertEqual(self.received['listener'], [('/audio', b'ping')])
+        self.assertEqual(self.received['dialer'], [('/video', b'pong')])
+
+    def test_in_order(self):
+        packets = [i.to_bytes(4, 'big') for i in range(100)]
+        for packet in packets:
+            self.dialer.send('/audio', packet)
+        self.assertTrue(wait_for(
+            lambda: len(self.received['listener']) == len(packets)))
+        self.assertEqual([p for _, p in self.received['listener']], packets)
+
+    def test_large_packet(self):
+        packet = bytes(range(256)) * 200  # Several UDP fragments
+        self.dialer.send('/video', packet)
+        self.assertTrue(wait_for(lambda: self.received['listener']))
+        self.assertEqual(self.received['listener'], [('/video', packet)])
+
+
+class TCPLoopbackTest(LoopbackTest, unittest.TestCase):
+    transport = TCPTransport
+
+    def test_peer_closed(self):
+        self.listener.close()
+        self.assertTrue(wait_for(lambda: not self.dialer.connected.is_set()))
+        self.assertFalse(self.dialer.send('/audio', b'lost'))
+
+
+class UDPLoopbackTest(LoopbackTest, unittest.TestCase):
+    transport = UDPTransport
+
+    def inject(self, channel, seq, idx=0, count=1, payload=b'x'):
+        """Send a hand-made datagram from the dialer's socket."""
+        self.dialer.sock.sendto(
+            UDPTransport.FRAME.pack(channel, seq, idx, count) + payload,
+            self.listener.sock.getsockname())
+
+    def test_duplicates_and_late(self):
+        for seq in (5, 5, 3, 6):
+            self.inject(0, seq, payload=seq.to_bytes(1, 'big'))
+        self.assertTrue(wait_for(lambda: len(self.received['listener']) == 2
+                                 and self.listener.late == 1))
+        self.assertEqual([p for _, p in self.received['listener']],
+                         [b'\x05', b'\x06'])
+        self.assertEqual(self.listener.duplicates, 1)
+        self.assertEqual(self.listener.late, 1)
+
+    def test_incomplete(self):
+        self.inject(0, 1, idx=0, count=2)  # Second fragment never arrives
+        self.inject(0, 2)
+        self.assertTrue(wait_for(lambda: self.listener.incomplete == 1))
+        self.assertEqual(self.received['listener'], [('/audio', b'x')])
+
+    def test_peer_timeout(self):
+        self.listener.PEER_TIMEOUT = self.dialer.PEER_TIMEOUT = 0.5
+        self.assertTrue(self.dialer.send('/audio', b'alive'))
+        self.listener.close()
+        self.assertTrue(wait_for(lambda: not self.dialer.connected.is_set()))
+        self.assertFalse(self.dialer.send('/audio', b'lost'))
+        self.assertFalse(self.dialer.stats()['connected'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import json
+import signal
 import socketio
-import sys
+
+from threading import Event
 
 from client.client import Client
 from client.api import ClientAPI
@@ -14,6 +16,11 @@ if __name__ == "__main__":
     with open(CONFIG) as json_data:
         config = json.load(json_data)
 
+    # Set on SIGINT/SIGTERM or when the frontend goes away
+    shutdown = Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: shutdown.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown.set())
+
     try:
         frontend_socket = socketio.Client()
         logger.info('Initializing client')
@@ -38,8 +45,14 @@ if __name__ == "__main__":
             logger.info(f'Received peer id {data} from frontend')
             client.connect_to_peer(data)
 
-        while True:
-            pass
+        @frontend_socket.on('disconnect')
+        def handle_frontend_disconnect():
+            logger.info('Frontend disconnected; shutting down')
+            shutdown.set()
+
+        shutdown.wait()
+        logger.info('Shutting down client')
+        client.kill()
 
     except Exception as f:
         raise f
@@ -1,47 +1,90 @@
 
 # audio.py
 
+import logging
 import sounddevice as sd
 import numpy as np
-import time as t
+
+from icebox.dsp import DAFProcessor
+
 
 class Audio:
-    def __init__(self, config):
+    def __init__(self, config, blocksize=256):
         self.config = config
+        self.blocksize = blocksize
         self.is_recording = False
         self.input_device = None
         self.output_device = None
-        self.in_stream = None
-        self.out_stream = None
+        self.stream = None
 
-    def start_recording(self):
-        self.is_recording = True
-        self.in_stream = sd.InputStream(device=self.input_device, callback=self.audio_callback)
-        self.out_stream = sd.OutputStream(device=self.output_device,samplerate=self.config.samplerate)
+        self.processor = None
+        self.mono = None
+
+        # Measured from callback timestamps (seconds)
+        self.device_latency = None
+        self.xruns = 0
 
-        # Initially write empty buffer audio to outputstream to delay playback of new writes
-        self.out_stream.start()
-        out_channels = self.out_stream.channels
-        delay_buffer_len = self.config.samplerate * (self.config.delay / 1000.0)
-        delay_buffer = np.zeros((int(delay_buffer_len),out_channels), dtype=np.float32)
-        self.out_stream.write(delay_buffer)
+    def start_recording(self):
+        samplerate = self.config.samplerate
+        self.processor = DAFProcessor(self.config, samplerate, self.blocksize)
+        self.mono = np.zeros(self.blocksize, dtype=np.float32)
+        self.device_latency = None
+        self.xruns = 0
 
-        self.in_stream.start()
+        # One duplex stream: input and output share a callback and clock,
+        # so the delay is exactly what the delay line applies plus the
+        # (fixed) device latency, and can't drift.
+        out_channels = min(2, sd.query_devices(
+            self.output_device, 'output')['max_output_channels'])
+        self.stream = sd.Stream(
+            device=(self.input_device, self.output_device),
+            samplerate=samplerate, blocksize=self.blocksize,
+            channels=(1, out_channels), dtype='float32',
+            latency='low', callback=self.audio_callback)
+        self.stream.start()
+        self.is_recording = True
+        logging.info(f"Started DAF stream with {self.config.delay} ms delay, "
+                     f"device latency {self.stream.latency}")
 
     def stop_recording(self):
-        if self.in_stream is not None:
-            self.in_stream.stop()
-            self.in_stream.close()
-        if self.out_stream is not None:
-            self.out_stream.stop()
-            self.out_stream.close()
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+            logging.info(f"Stopped DAF stream: {self.get_latency()}")
         self.is_recording = False
 
-    def audio_callback(self, indata, frames, time, status):
-        self.out_stream.write(indata)
+    def audio_callback(self, indata, outdata, frames, time, status):
+        if status:
+            self.xruns += 1
+        mono = self.processor.process(indata[:, 0], self.mono[:frames])
+        outdata[:] = mono[:, np.newaxis]
+
+        latency = time.outputBufferDacTime - time.inputBufferAdcTime
+        if latency > 0:
+            self.device_latency = latency
+
+    def get_latency(self):
+        """
+        Round-trip latency in ms: the configured delay plus what the audio
+        devices add. Device latency is measured from callback timestamps
+        where the host API provides them, or taken from the stream's
+        reported latency otherwise.
+        """
+        device = self.device_latency
+        if device is None and self.stream is not None:
+            device = sum(self.stream.latency)
+        device_ms = 1000.0 * device if device is not None else None
+        delay_ms = self.processor.delay_ms if self.processor else 0.0
+        return {
+            'delay_ms': delay_ms,
+            'device_ms': device_ms,
+            'total_ms': delay_ms + device_ms if device_ms is not None else None,
+            'xruns': self.xruns,
+        }
 
     def set_input_device(self, device):
         self.input_device = device
-        
+
     def set_output_device(self, device):
-        self.output_device = device
\ No newline at end of file
+        self.output_device = device
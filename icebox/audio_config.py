@@ -9,8 +9,11 @@ class Config:
     def __init__(self, config_file = None):
         self.delay = 0
         self.samplerate = 44100
+        self.taps = []  # Extra (delay ms, gain) echoes on top of `delay`
+        self.dry = 0.0  # Gain of the undelayed input in the output
+        self.pitch = 0  # Pitch shift of the delayed signal, in semitones
         if config_file:
-          self.set_config_from_yaml(self.read_and_validate_yaml(config_file))
+          self.set_config_from_yaml(config_file)
 
     def get_delay(self):
         return self.delay
@@ -26,6 +29,28 @@ class Config:
         self.samplerate = samplerate
         logging.info(f'Set sample rate to {samplerate} Hz')
 
+    def get_taps(self):
+        return self.taps
+
+    def set_taps(self, taps):
+        # Replaced rather than mutated so running audio notices the change
+        self.taps = [(delay, gain) for delay, gain in taps]
+        logging.info(f'Set taps to {self.taps}')
+
+    def get_dry(self):
+        return self.dry
+
+    def set_dry(self, dry):
+        self.dry = dry
+        logging.info(f'Set dry mix to {dry}')
+
+    def get_pitch(self):
+        return self.pitch
+
+    def set_pitch(self, pitch):
+        self.pitch = pitch
+        logging.info(f'Set pitch shift to {pitch} semitones')
+
     def read_and_validate_yaml(self, yaml_file):
         if not os.path.exists(yaml_file):
             logging.error(f"The file {yaml_file} does not exist.")
@@ -53,6 +78,20 @@ class Config:
         
         assert 8000 <= config['audio']['samplerate'] <= 96000
         self.set_samplerate(config['audio']['samplerate'])
+
+        # Optional effects
+        if 'taps' in config['audio']:
+            taps = config['audio']['taps']
+            assert all(0 <= delay <= 10000 for delay, _ in taps)
+            self.set_taps(taps)
+
+        if 'dry' in config['audio']:
+            assert 0 <= config['audio']['dry'] <= 1
+            self.set_dry(config['audio']['dry'])
+
+        if 'pitch' in config['audio']:
+            assert -12 <= config['audio']['pitch'] <= 12
+            self.set_pitch(config['audio']['pitch'])
         
         logging.info("Configuration successfully applied.")
 
@@ -0,0 +1,249 @@
+
+# dsp.py
+
+import numpy as np
+
+MAX_DELAY_MS = 10000  # Upper bound enforced by Config / the GUI
+
+# NOTE: Everything on the per-block path below writes into preallocated
+# arrays (`out=` everywhere). Arrays are only (re)allocated when the
+# configuration changes, never per block, so the live callback doesn't
+# allocate.
+
+
+class DelayLine:
+    """
+    Preallocated mono ring buffer that plays its input back `delay`
+    samples later, sample-accurately.
+    """
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.head = 0  # Index the next block is written at
+
+    def write(self, block):
+        n = len(block)
+        start = self.head
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:n - first] = block[first:]
+        self.head = (start + n) % self.capacity
+
+    def read(self, delay, out):
+        """
+        Fill `out` with the samples written `delay` samples before the
+        block last written (which must have been `len(out)` long).
+        """
+        n = len(out)
+        start = (self.head - n - delay) % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:n - first]
+
+
+class MultiTap:
+    """
+    Weighted sum of several delayed copies of a `DelayLine`, gathered for
+    all taps at once with a single `take` and a single dot product.
+
+    Parameters
+    ----------
+    delay_line : DelayLine
+    blocksize : int
+    delays : list of int
+        In samples.
+    gains : list of float
+    """
+
+    def __init__(self, delay_line, blocksize, delays, gains):
+        self.line = delay_line
+        self.blocksize = blocksize
+        self.delays = np.asarray(delays, dtype=np.int64)
+        self.gains = np.asarray(gains, dtype=np.float32)
+
+        # Position of each output sample relative to the write head
+        ramp = np.arange(blocksize, dtype=np.int64) - blocksize
+        self.offsets = ramp[np.newaxis, :] - self.delays[:, np.newaxis]
+        self.index = np.empty_like(self.offsets)
+        self.taps = np.empty(self.offsets.shape, dtype=np.float32)
+
+    def read(self, out):
+        if len(out) == self.blocksize:
+            np.add(self.offsets, self.line.head, out=self.index)
+            np.take(self.line.buffer, self.index, mode='wrap', out=self.taps)
+            np.dot(self.gains, self.taps, out=out)
+            return
+
+        # Short (final) block when processing files; tap by tap
+        out[:] = 0
+        scratch = self.taps[0, :len(out)]
+        for delay, gain in zip(self.delays, self.gains):
+            self.line.read(int(delay), scratch)
+            scratch *= gain
+            out += scratch
+
+
+class PitchShifter:
+    """
+    Delay-line pitch shifter: two read heads sweep a short window at a
+    rate set by the pitch ratio and are crossfaded with triangular
+    windows that always sum to one. Adds about half a window of latency.
+
+    Parameters
+    ----------
+    samplerate : int
+    blocksize : int
+    window_ms : float, optional
+    """
+
+    def __init__(self, samplerate, blocksize, window_ms=40):
+        self.window = int(samplerate * window_ms / 1000.0)
+        self.line = DelayLine(self.window + 2 * blocksize + 2)
+        self.phase = 0.0
+
+        # All float32 (positions stay within a few thousand samples) so
+        # that no operation needs a casting buffer
+        self.ramp = np.arange(blocksize, dtype=np.float32)
+        self.sweep = np.empty(blocksize, dtype=np.float32)
+        self.head = np.empty(blocksize, dtype=np.float32)
+        self.position = np.empty(blocksize, dtype=np.float32)
+        self.frac = np.empty(blocksize, dtype=np.float32)
+        self.gain = np.empty(blocksize, dtype=np.float32)
+        self.index = np.empty(blocksize, dtype=np.int64)
+        self.lower = np.empty(blocksize, dtype=np.float32)
+        self.upper = np.empty(blocksize, dtype=np.float32)
+
+    def process(self, block, out, ratio):
+        """
+        Shift `block` by `ratio` (2.0 is an octave up) into `out`, which
+        may be `block` itself.
+        """
+        n = len(block)
+        start = self.line.head
+        self.line.write(block)
+
+        # Phase of the first head in [0, 1); delay = phase * window
+        step = (1.0 - ratio) / self.window
+        sweep = self.sweep[:n]
+        np.multiply(self.ramp[:n], step, out=sweep)
+        sweep += self.phase
+        np.remainder(sweep, 1.0, out=sweep)
+        self.phase = (self.phase + n * step) % 1.0
+
+        head, position = self.head[:n], self.position[:n]
+        frac, gain, index = self.frac[:n], self.gain[:n], self.index[:n]
+        lower, upper = self.lower[:n], self.upper[:n]
+
+        out[:] = 0
+        for offset in (0.0, 0.5):
+            np.add(sweep, offset, out=head)
+            np.remainder(head, 1.0, out=head)
+
+            # Fractional read position, linearly interpolated
+            np.multiply(head, -self.window, out=position)
+            position += self.ramp[:n]
+            position += start
+            np.floor(position, out=frac)
+            np.copyto(index, frac, casting='unsafe')
+            np.subtract(position, frac, out=frac)
+            np.take(self.line.buffer, index, mode='wrap', out=lower)
+            index += 1
+            np.take(self.line.buffer, index, mode='wrap', out=upper)
+            upper -= lower
+            upper *= frac
+            upper += lower
+
+            # Triangular window: 0 at the ends of the sweep, 1 mid-way
+            np.multiply(head, 2.0, out=gain)
+            gain -= 1.0
+            np.abs(gain, out=gain)
+            np.subtract(1.0, gain, out=gain)
+            upper *= gain
+            out += upper
+        return out
+
+
+class DAFProcessor:
+    """
+    The delayed auditory feedback signal path, independent of where the
+    blocks come from: live devices (`Audio`) or files (`offline_audio`).
+
+    The wet signal is `config.delay` plus any extra `config.taps`
+    (`(delay_ms, gain)` pairs), optionally pitch shifted by
+    `config.pitch` semitones, and mixed with `config.dry` of the input.
+    The configuration is checked on every block, so it can be changed
+    while processing; tap changes are crossfaded over one block.
+    """
+
+    def __init__(self, config, samplerate, blocksize):
+        self.config = config
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        capacity = int(samplerate * MAX_DELAY_MS / 1000.0) + 2 * blocksize
+        self.delay_line = DelayLine(capacity)
+        self.shifter = PitchShifter(samplerate, blocksize)
+
+        self.old = np.zeros(blocksize, dtype=np.float32)
+        self.dry = np.zeros(blocksize, dtype=np.float32)
+        self.fade = np.linspace(0, 1, blocksize, endpoint=False,
+                                dtype=np.float32)
+
+        self.applied = (None, None)  # (delay, taps) the tap set reflects
+        self.pitch = None
+        self.ratio = 1.0
+        self.taps = self.make_taps()
+
+    def samples(self, ms):
+        return int(self.samplerate * ms / 1000.0)
+
+    def make_taps(self):
+        config = self.config
+        self.applied = (config.delay, config.taps)
+        delays = [self.samples(config.delay)]
+        delays += [self.samples(delay) for delay, _ in config.taps]
+        gains = [1.0] + [gain for _, gain in config.taps]
+        return MultiTap(self.delay_line, self.blocksize, delays, gains)
+
+    def taps_changed(self):
+        delay, taps = self.applied
+        return self.config.delay != delay or self.config.taps is not taps
+
+    def process(self, block, out):
+        """
+        Process one mono block (at most `blocksize` samples) into `out`.
+        """
+        n = len(block)
+        self.delay_line.write(block)
+
+        if self.taps_changed():
+            old = self.old[:n]
+            self.taps.read(old)
+            self.taps = self.make_taps()
+            self.taps.read(out)
+            out -= old
+            out *= self.fade[:n]
+            out += old
+        else:
+            self.taps.read(out)
+
+        if self.config.pitch != self.pitch:
+            self.pitch = self.config.pitch
+            self.ratio = 2.0 ** (self.pitch / 12.0)
+        if self.pitch:
+            self.shifter.process(out, out, self.ratio)
+
+        if self.config.dry:
+            dry = self.dry[:n]
+            np.multiply(block, self.config.dry, out=dry)
+            out += dry
+        return out
+
+    @property
+    def delay(self):
+        """Primary delay currently applied, in samples."""
+        return int(self.taps.delays[0])
+
+    @property
+    def delay_ms(self):
+        return 1000.0 * self.delay / self.samplerate
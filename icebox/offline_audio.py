@@ -0,0 +1,127 @@
+
+# offline_audio.py
+
+import argparse
+import logging
+import time
+import wave
+import numpy as np
+
+from icebox.audio_config import Config
+from icebox.dsp import DAFProcessor
+
+logging.basicConfig(level=logging.INFO)
+
+# WAV sample width (bytes) -> (dtype, full scale)
+SAMPLE_FORMATS = {
+    1: (np.uint8, 128.0),  # 8-bit WAV is unsigned
+    2: (np.int16, 32768.0),
+    4: (np.int32, 2147483648.0),
+}
+
+
+def read_blocks(path, blocksize):
+    """
+    Yield `(samplerate, block)` for consecutive mono float32 blocks of a
+    WAV file, mixing channels down. Only one block is held in memory.
+    """
+    with wave.open(path, 'rb') as wav:
+        width = wav.getsampwidth()
+        if width not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+        dtype, scale = SAMPLE_FORMATS[width]
+        channels = wav.getnchannels()
+        samplerate = wav.getframerate()
+
+        while True:
+            frames = wav.readframes(blocksize)
+            if not frames:
+                return
+            block = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+            if dtype == np.uint8:
+                block -= scale
+            block /= scale
+            if channels > 1:
+                block = block.reshape(-1, channels).mean(axis=1)
+            yield samplerate, block
+
+
+def process_wav(path, config, blocksize=256):
+    """
+    Stream a WAV file through the DAF path in fixed-size blocks,
+    yielding each processed block. The output block is reused, so copy
+    it if it needs to outlive the next iteration.
+    """
+    processor = None
+    out = np.zeros(blocksize, dtype=np.float32)
+    for samplerate, block in read_blocks(path, blocksize):
+        if processor is None:
+            processor = DAFProcessor(config, samplerate, blocksize)
+        yield processor.process(block, out[:len(block)])
+
+
+def write_wav(path, blocks, samplerate):
+    """Write float32 mono blocks to a 16-bit WAV file."""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(samplerate)
+        for block in blocks:
+            pcm = np.clip(block * 32767.0, -32768, 32767).astype(np.int16)
+            wav.writeframes(pcm.tobytes())
+
+
+def benchmark(path, config, blocksize=256):
+    """
+    Process a WAV file without output and report throughput as a multiple
+    of real time, along with the per-block deadline the live callback has
+    to meet at that block size.
+    """
+    with wave.open(path, 'rb') as wav:
+        samplerate = wav.getframerate()
+
+    samples = 0
+    blocks = 0
+    start = time.perf_counter()
+    for block in process_wav(path, config, blocksize):
+        samples += len(block)
+        blocks += 1
+    elapsed = time.perf_counter() - start
+
+    audio_s = samples / samplerate
+    return {
+        'audio_s': audio_s,
+        'elapsed_s': elapsed,
+        'x_realtime': audio_s / elapsed if elapsed else float('inf'),
+        'block_us': 1e6 * elapsed / blocks if blocks else 0.0,
+        'deadline_us': 1e6 * blocksize / samplerate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply delayed auditory feedback to a WAV file.")
+    parser.add_argument('input')
+    parser.add_argument('-o', '--output', help="Processed WAV to write")
+    parser.add_argument('-c', '--config', help="YAML config file")
+    parser.add_argument('-d', '--delay', type=int, help="Delay in ms")
+    parser.add_argument('-b', '--blocksize', type=int, default=256)
+    args = parser.parse_args()
+
+    config = Config(args.config)
+    if args.delay is not None:
+        config.set_delay(args.delay)
+
+    if args.output:
+        with wave.open(args.input, 'rb') as wav:
+            samplerate = wav.getframerate()
+        write_wav(args.output,
+                  process_wav(args.input, config, args.blocksize), samplerate)
+        logging.info(f"Wrote {args.output}")
+    else:
+        stats = benchmark(args.input, config, args.blocksize)
+        logging.info(f"Throughput: {stats}")
+
+
+if __name__ == "__main__":
+    main()
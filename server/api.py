@@ -245,15 +245,31 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
         ------------------
         user_id : str
         peer_id : str
-        socket_endpoint : tuple(str, int)
+        key_epoch : float
+        key_offset : int
+        media_endpoint : tuple, optional
+            Direct media link offered to the peer.
+        media_transport : str, optional
+            Transport of that link ('TCP' or 'UDP').
+        audio_codecs : list of str, optional
+            Audio codecs the user can decode; PCM only if absent.
         """
-        user_id, peer_id = get_parameters(request.json, 'user_id', 'peer_id')
+        user_id, peer_id, key_epoch, key_offset = get_parameters(
+            request.json, 'user_id', 'peer_id',
+            ('key_epoch', lambda x: isinstance(x, (int, float))),
+            ('key_offset', is_type(int)))
         cls.logger.info(f"Received request from User {
                         user_id} to connect with User {peer_id}.")
 
-        endpoint = cls.server.handle_peer_connection(user_id, peer_id)
+        endpoint, reply = cls.server.handle_peer_connection(
+            user_id, peer_id, key_epoch, key_offset,
+            request.json.get('media_endpoint'),
+            request.json.get('media_transport'),
+            request.json.get('audio_codecs'))
 
-        return jsonify({'socket_endpoint': tuple(endpoint)}), 200
+        return jsonify({'socket_endpoint': tuple(endpoint),
+                        'audio_codecs': reply.get('audio_codecs'),
+                        'key_offset': reply.get('key_offset')}), 200
 
     # endregion
 # endregion
@@ -94,7 +94,9 @@ class Server:
         self.websocket_instance = self.SocketAPI.init(self, users)
         self.websocket_instance.start()
 
-    def handle_peer_connection(self, user_id, peer_id):
+    def handle_peer_connection(self, user_id, peer_id, key_epoch, key_offset,
+                               media_endpoint=None, media_transport=None,
+                               audio_codecs=None):
         if user_id == peer_id:
             raise BadRequest(f"Cannot intermediate connection between User {
                              user_id} and self.")
@@ -125,7 +127,13 @@ class Server:
         try:
             response = self.contact_client(peer_id, '/peer_connection', json={
                 'peer_id': user_id,
-                'socket_endpoint': tuple(self.websocket_endpoint)
+                'socket_endpoint': tuple(self.websocket_endpoint),
+                'key_epoch': key_epoch,
+                'key_offset': key_offset,
+                # Direct media link offered by the user, if any
+                'media_endpoint': media_endpoint,
+                'media_transport': media_transport,
+                'audio_codecs': audio_codecs,
             })
         except Exception as e:
             raise BadGateway(f"Unable to reach peer User {peer_id}.")
@@ -135,7 +143,8 @@ class Server:
             raise BadGateway(
                 f"Peer User {peer_id} refused connection request.")
         logger.info(f"Peer User {peer_id} accepted connection request.")
-        return self.websocket_endpoint
+        # The peer's audio codecs and agreed key offset, for the user
+        return self.websocket_endpoint, response.json()
 
 # endregion
 
@@ -72,9 +72,10 @@ class BroadcastFlaskNamespace(FlaskNamespace):
         # self.cls.logger.info(f"Socket connection established to endpoint {self.cls.endpoint} on namespace {self.namespace}")
         pass
 
-    def on_message(self, user_id, msg):
+    def on_message(self, packet):
+        # Media packets are opaque binary frames (header + encrypted payload)
         # Change include_self to True if you want your own video to be displayed
-        send((user_id, msg), broadcast=True, include_self=False)
+        send(packet, broadcast=True, include_self=False)
 
     def on_disconnect(self):
         # self.cls.logger.info(f"Client disconnected from namespace {self.namespace}.")